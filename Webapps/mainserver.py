@@ -1,6 +1,8 @@
 import yaml
-import requests
 import json
+import asyncio
+import httpx
+import websockets
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
@@ -13,26 +15,255 @@ try:
         config = yaml.safe_load(f)
     STT_SERVICE_URL = config['services']['STT_ENDPOINT']     # e.g. "http://localhost:5002/transcribe"
     RAG_LLM_SERVICE_URL = config['services']['LLM_ENDPOINT'] # e.g. "http://localhost:8001/query"
+    PREFETCH_SERVICE_URL = config['services'].get('PREFETCH_ENDPOINT') # e.g. "http://localhost:8001/prefetch"
+    STT_STREAM_URL = config['services'].get('STT_STREAM_ENDPOINT')     # e.g. "ws://localhost:5002/ws/stream"
+    HTTP_CFG = config['services'].get('http', {})
 except (FileNotFoundError, KeyError):
     print("ERROR: config.yaml not found or missing required service endpoints.")
     exit()
 
+# --- Shared HTTP clients ---
+# One keep-alive pool per backend service, created once and reused by every WebSocket session,
+# so a slow STT/RAG call only parks its own coroutine instead of blocking the event loop.
+RETRIES = int(HTTP_CFG.get('retries', 2))
+RETRY_BACKOFF_S = float(HTTP_CFG.get('retry_backoff_s', 0.25))
+# Only failures where the request never reached the service (or it shed load up front) are
+# retried: a read timeout on /transcribe or /query means the work is already running there.
+RETRY_STATUS = {503}
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+STT_TIMEOUT_S = float(HTTP_CFG.get('stt_timeout_s', 30))
+service_clients = {}
+
+def make_client(read_timeout_s: float) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(read_timeout_s, connect=float(HTTP_CFG.get('connect_timeout_s', 3))),
+        limits=httpx.Limits(
+            max_connections=int(HTTP_CFG.get('max_connections', 100)),
+            max_keepalive_connections=int(HTTP_CFG.get('max_keepalive', 20)),
+        ),
+    )
+
+@app.on_event("startup")
+async def open_service_clients():
+    service_clients['stt'] = make_client(STT_TIMEOUT_S)
+    service_clients['rag'] = make_client(float(HTTP_CFG.get('rag_timeout_s', 30)))
+
+@app.on_event("shutdown")
+async def close_service_clients():
+    for client in service_clients.values():
+        await client.aclose()
+
+background_tasks = set()
+
+async def prefetch_for_target(target_object: str):
+    """Asks the RAG service to precompute its candidate set for a target, ignoring failures."""
+    try:
+        await post_with_retry('rag', PREFETCH_SERVICE_URL, json={'target_object': target_object})
+        print(f"Prefetched candidates for target: '{target_object}'")
+    except httpx.HTTPError as e:
+        print(f"[WARN] Prefetch for '{target_object}' failed: {e}")
+
+def schedule_prefetch(target_object: str):
+    task = asyncio.create_task(prefetch_for_target(target_object))
+    background_tasks.add(task)  # keep a reference until it finishes
+    task.add_done_callback(background_tasks.discard)
+
+async def post_with_retry(service: str, url: str, **kwargs) -> httpx.Response:
+    """POST with exponential backoff on connect failures and 503 (honouring Retry-After); read timeouts fail fast."""
+    client = service_clients[service]
+    for attempt in range(RETRIES + 1):
+        delay = RETRY_BACKOFF_S * (2 ** attempt)
+        try:
+            response = await client.post(url, **kwargs)
+            if response.status_code not in RETRY_STATUS or attempt == RETRIES:
+                response.raise_for_status()
+                return response
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+        except RETRY_ERRORS:
+            if attempt == RETRIES:
+                raise
+        print(f"[WARN] {service} call failed (attempt {attempt + 1}/{RETRIES + 1}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Used when the client hasn't reported a target yet (coco-ssd has no gym-machine classes).
+DEFAULT_TARGET_OBJECT = 'leg press machine'
+
+class SttStream:
+    """
+    One persistent WebSocket to the STT service per client session. Audio chunks are relayed
+    as they arrive so STT decodes while the user is still talking; "end" returns the result.
+    The chunks are also kept so the utterance can still go through /transcribe if the
+    stream breaks.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.conn = None
+        self.chunks = []
+        self.relaying = False
+
+    async def start(self):
+        self.chunks = []
+        self.relaying = False
+        if not self.url:  # streaming STT not configured: buffer and POST at the end
+            return
+        try:
+            if self.conn is None or self.conn.close_code is not None:
+                self.conn = await websockets.connect(self.url, max_size=None)
+            self.relaying = True
+        except (OSError, websockets.WebSocketException) as e:
+            print(f"[WARN] STT stream unavailable, falling back to HTTP: {e}")
+
+    async def feed(self, chunk: bytes):
+        self.chunks.append(chunk)
+        if not self.relaying:
+            return
+        try:
+            await self.conn.send(chunk)
+        except websockets.WebSocketException as e:
+            print(f"[WARN] STT stream dropped mid-utterance, falling back to HTTP: {e}")
+            self.relaying = False
+
+    @property
+    def size(self) -> int:
+        return sum(len(c) for c in self.chunks)
+
+    async def finish(self):
+        """Returns the STT result dict, or None if the stream failed (use the buffered audio)."""
+        if not self.relaying:
+            return None
+        try:
+            await self.conn.send("end")
+            return json.loads(await asyncio.wait_for(self.conn.recv(), STT_TIMEOUT_S))
+        except asyncio.TimeoutError:
+            # Same budget as the HTTP path; drop the connection so a late reply can't be read
+            # as the next utterance's result
+            print(f"[WARN] STT stream gave no result within {STT_TIMEOUT_S:.0f}s")
+            conn, self.conn = self.conn, None
+            await conn.close()
+            return {"error": f"no transcription within {STT_TIMEOUT_S:.0f}s"}
+        except websockets.WebSocketException as e:
+            print(f"[WARN] STT stream failed at end of utterance, falling back to HTTP: {e}")
+            return None
+        finally:
+            self.relaying = False
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+
+async def transcribe_via_http(audio_bytes: bytes) -> dict:
+    stt_files = {'audio_file': ('query.wav', audio_bytes, 'audio/wav')}
+    stt_response = await post_with_retry('stt', STT_SERVICE_URL, files=stt_files)
+    return stt_response.json()
+
+async def send_transcription(websocket: WebSocket, stt_result: dict) -> str:
+    """Reports the STT outcome to the client; returns the text, or "" if there is nothing to search."""
+    if stt_result.get('error'):
+        await websocket.send_json({"error": f"STT service is busy: {stt_result['error']}"})
+        return ""
+    user_query_text = stt_result['transcription']
+    print(f"STT Service returned: '{user_query_text}'")
+
+    # If STT service returns an empty string, treat it as an error
+    if not user_query_text.strip():
+        print("[WARN] STT service returned an empty transcription. Skipping RAG.")
+        await websocket.send_json({"error": "Could not understand the audio. Please speak clearly and try again."})
+        return ""
+
+    # IMPORTANT: Send the transcribed text back to the front-end so it can cache it
+    await websocket.send_json({"status": "Transcribed", "transcribed_text": user_query_text})
+    return user_query_text
+
+async def answer_query(websocket: WebSocket, user_query_text: str, target_object: str, seen_urls: list):
+    try:
+        await websocket.send_json({"status": f"Searching for: '{user_query_text}'"})
+
+        combined_query = f"{user_query_text} {target_object}"
+        rag_payload = {
+            'query': combined_query,
+            'seen_video_urls': seen_urls,
+            'target_object': target_object
+        }
+
+        rag_response = await post_with_retry('rag', RAG_LLM_SERVICE_URL, json=rag_payload)
+        video_result = rag_response.json()
+        print(video_result)
+        await websocket.send_json({"status": "Done", "result": video_result})
+        print(f"Sent video result to client: {video_result.get('video_title')}")
+
+    except httpx.HTTPError as e:
+        await websocket.send_json({"error": f"RAG service is unavailable: {e}"})
+    except Exception as e:
+        await websocket.send_json({"error": f"An error occurred during RAG processing: {e}"})
+
 @app.websocket("/ws/query")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    current_target = None  # last target reported by this client's object detector
+    stt_stream = SttStream(STT_STREAM_URL)
+    utterance = None       # {"target_object", "seen_urls"} while a streamed recording is open
     try:
         while True:
-            # The WebSocket now handles two types of incoming messages.
-            # It will always receive a JSON text message first.
-            
-            message_str = await websocket.receive_text()
-            message_data = json.loads(message_str)
-            
-            target_object = 'leg press machine'        #message_data.get("target_object")
+            # Messages are JSON text, except while streaming (audio_start ... audio_end), when
+            # binary audio chunks arrive in between; the legacy path sends one binary blob
+            # right after its JSON header.
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            if message.get("bytes") is not None:
+                if utterance is not None:
+                    await stt_stream.feed(message["bytes"])
+                continue
+            message_data = json.loads(message["text"])
+
+            # --- Target update: speculatively prefetch while the user is still aiming/speaking ---
+            if message_data.get("type") == "target_update":
+                new_target = message_data.get("target_object")
+                if new_target and new_target != current_target:
+                    current_target = new_target
+                    if PREFETCH_SERVICE_URL:
+                        schedule_prefetch(new_target)
+                continue
+
+            target_object = message_data.get("target_object") or current_target or DEFAULT_TARGET_OBJECT
             seen_urls = message_data.get("seen_urls", [])
-            
+
+            # --- Streaming mode: chunks are relayed to STT while the user is still talking ---
+            if message_data.get("type") == "audio_start":
+                utterance = {"target_object": target_object, "seen_urls": seen_urls}
+                await stt_stream.start()
+                continue
+
+            if message_data.get("type") == "audio_end":
+                if utterance is None:
+                    continue
+                target_object = message_data.get("target_object") or utterance["target_object"]
+                seen_urls = utterance["seen_urls"]
+                utterance = None
+                print(f"Received streamed audio query ({stt_stream.size} bytes) for object: '{target_object}'")
+                if stt_stream.size < 1024:
+                    await stt_stream.finish()
+                    await websocket.send_json({"error": "No audio was detected in the recording. Please try again."})
+                    continue
+                try:
+                    await websocket.send_json({"status": "Transcribing audio..."})
+                    stt_result = await stt_stream.finish()
+                    if stt_result is None:
+                        stt_result = await transcribe_via_http(b"".join(stt_stream.chunks))
+                except httpx.HTTPError as e:
+                    await websocket.send_json({"error": f"STT service is unavailable: {e}"})
+                    continue
+                user_query_text = await send_transcription(websocket, stt_result)
+                if user_query_text:
+                    await answer_query(websocket, user_query_text, target_object, seen_urls)
+                continue
+
             user_query_text = "" # Initialize to empty
 
             # --- DYNAMIC LOGIC: Check if we need to do STT ---
@@ -50,52 +281,19 @@ async def websocket_endpoint(websocket: WebSocket):
                     continue 
                 try:
                     await websocket.send_json({"status": "Transcribing audio..."})
-                    stt_files = {'audio_file': ('query.wav', audio_bytes, 'audio/wav')}
-                    stt_response = requests.post(STT_SERVICE_URL, files=stt_files)
-                    stt_response.raise_for_status()
-                    
-                    stt_result = stt_response.json()
-                    user_query_text = stt_result['transcription']
-                    print(f"STT Service returned: '{user_query_text}'")
-
-                    # If STT service returns an empty string, treat it as an error
-                    if not user_query_text.strip():
-                         print("[WARN] STT service returned an empty transcription. Skipping RAG.")
-                         await websocket.send_json({"error": "Could not understand the audio. Please speak clearly and try again."})
-                         continue
-                    
-                    # IMPORTANT: Send the transcribed text back to the front-end so it can cache it
-                    await websocket.send_json({"status": "Transcribed", "transcribed_text": user_query_text})
-
-                except requests.exceptions.RequestException as e:
+                    user_query_text = await send_transcription(websocket, await transcribe_via_http(audio_bytes))
+                except httpx.HTTPError as e:
                     await websocket.send_json({"error": f"STT service is unavailable: {e}"})
                     continue # Wait for the next message
             
             # --- RAG Call (This part is now common to both paths) ---
             if user_query_text:
-                try:
-                    await websocket.send_json({"status": f"Searching for: '{user_query_text}'"})
-
-                    combined_query = f"{user_query_text} {target_object}"
-                    rag_payload = {
-                        'query': combined_query,
-                        'seen_video_urls': seen_urls
-                    }
-
-                    rag_response = requests.post(RAG_LLM_SERVICE_URL, json=rag_payload)
-                    rag_response.raise_for_status()
-                    video_result = rag_response.json()
-                    print(video_result)
-                    await websocket.send_json({"status": "Done", "result": video_result})
-                    print(f"Sent video result to client: {video_result.get('video_title')}")
-                
-                except requests.exceptions.RequestException as e:
-                    await websocket.send_json({"error": f"RAG service is unavailable: {e}"})
-                except Exception as e:
-                    await websocket.send_json({"error": f"An error occurred during RAG processing: {e}"})
+                await answer_query(websocket, user_query_text, target_object, seen_urls)
 
     except WebSocketDisconnect:
         print("Client disconnected")
+    finally:
+        await stt_stream.close()
 
 # --- Frontend Call ---
 @app.get("/")
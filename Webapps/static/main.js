@@ -14,6 +14,12 @@ let model = undefined;
 let mediaRecorder;
 let audioChunks = [];
 
+// Streaming mode: send the recording in timeslices while the user is still talking, so the
+// gateway/STT can decode as it goes. Set to false to upload one blob on release instead.
+const STREAM_AUDIO = true;
+const AUDIO_TIMESLICE_MS = 250;
+let streamingUtterance = false;
+
 // State management for the current session
 const currentSession = {
     targetObject: null,  // cross hair pointing at
@@ -27,12 +33,41 @@ const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
 const WEBSOCKET_URL = `${protocol}://${host}/ws/query`;
 let socket;
 
+// --- Speculative prefetch: tell the gateway as soon as the crosshair target settles ---
+const TARGET_UPDATE_DEBOUNCE_MS = 300;
+let lastSentTarget = null;
+let pendingTarget = null;   // target the debounce timer is waiting on
+let targetUpdateTimer = null;
+
+function scheduleTargetUpdate(target) {
+    // Called every detection frame: only a change of target restarts the timer, so a target
+    // that stays in view is sent once it has been stable for the debounce interval
+    if (target === pendingTarget) {
+        return;
+    }
+    clearTimeout(targetUpdateTimer);
+    pendingTarget = target;
+    if (!target || target === lastSentTarget) {
+        return;
+    }
+    targetUpdateTimer = setTimeout(() => {
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify({ type: "target_update", target_object: target }));
+            lastSentTarget = target;
+        } else {
+            pendingTarget = null; // not sent: let the next frame schedule it again
+        }
+    }, TARGET_UPDATE_DEBOUNCE_MS);
+}
+
 function connectWebSocket() {
     console.log("Attempting to connect WebSocket...");
     socket = new WebSocket(WEBSOCKET_URL);
 
     socket.onopen = (event) => {
         console.log("WebSocket connection established.");
+        lastSentTarget = null; // the new connection has no target yet
+        pendingTarget = null;
         statusDiv.innerText = "Status: Aim at a recognized object";
         statusDiv.style.color = 'yellow';
     };
@@ -232,6 +267,7 @@ async function detectionLoop() {
             if (!objectFound) {
                 currentSession.targetObject = null;
             }
+            scheduleTargetUpdate(currentSession.targetObject);
             // Update the status text on the UI
             const statusDiv = document.getElementById('status-text');
             if (currentSession.targetObject) {
@@ -276,10 +312,21 @@ recordButton.addEventListener('mousedown', () => {
             console.log("Microphone access granted. Starting recorder.");
             audioChunks = [];
             mediaRecorder = new MediaRecorder(stream);
+            streamingUtterance = STREAM_AUDIO && socket && socket.readyState === WebSocket.OPEN;
+            if (streamingUtterance) {
+                socket.send(JSON.stringify({
+                    type: "audio_start",
+                    target_object: currentSession.targetObject,
+                    seen_urls: []
+                }));
+            }
             mediaRecorder.ondataavailable = event => {
                 audioChunks.push(event.data);
+                if (streamingUtterance && event.data.size > 0 && socket.readyState === WebSocket.OPEN) {
+                    socket.send(event.data);
+                }
             };
-            mediaRecorder.start();
+            mediaRecorder.start(streamingUtterance ? AUDIO_TIMESLICE_MS : undefined);
             recordButton.style.backgroundColor = 'blue'; // Indicate recording is active
         })
         .catch(error => {
@@ -300,6 +347,19 @@ recordButton.addEventListener('mouseup', () => {
         mediaRecorder.onstop = () => {
             const audioBlob = new Blob(audioChunks, { type: 'audio/wav' });
              
+            // Streaming: every chunk (including the last one, delivered before onstop) is already sent
+            if (streamingUtterance) {
+                if (socket.readyState === WebSocket.OPEN) {
+                    console.log(`Finished streaming query for '${currentSession.targetObject}'`);
+                    socket.send(JSON.stringify({ type: "audio_end" }));
+                } else {
+                    alert("Connection to server was lost while recording.");
+                    recordButton.disabled = false;
+                    recordButton.style.backgroundColor = 'red';
+                }
+                return;
+            }
+
             if (audioBlob.size === 0) {
                 console.warn("Empty audio recorded. Not sending to server.");
                 statusDiv.innerText = "No audio detected. Please try again.";
@@ -0,0 +1,100 @@
+# Semantic response cache for /ask_xr: near-duplicate questions over the same retrieved
+# chunks and scene notes reuse the stored answer instead of calling the LLM again.
+import time, threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Sequence
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    def __init__(self, similarity_threshold: float = 0.92, ttl_seconds: float = 3600, max_entries: int = 1000):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _context_key(chunk_ids: Sequence[Any], notes: Optional[Sequence[str]]):
+        return (frozenset(str(c) for c in chunk_ids), tuple(notes or ()))
+
+    def _check_version(self, version: Hashable):
+        # Caller holds the lock. A re-ingested collection makes every stored answer suspect.
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, query_vector: np.ndarray, chunk_ids: Sequence[Any], notes: Optional[Sequence[str]], version: Hashable):
+        q = np.asarray(query_vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        context = self._context_key(chunk_ids, notes)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            best_id, best_sim = None, self.similarity_threshold
+            for entry_id, entry in list(self._entries.items()):
+                if now - entry["created"] > self.ttl_seconds:
+                    del self._entries[entry_id]
+                    continue
+                if entry["context"] != context:
+                    continue
+                sim = float(np.dot(entry["vector"], q))
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id]["response"]
+
+    def put(self, query_vector: np.ndarray, chunk_ids: Sequence[Any], notes: Optional[Sequence[str]], version: Hashable, response: Any):
+        q = np.array(query_vector, dtype=np.float32)
+        q /= (np.linalg.norm(q) or 1.0)
+        with self._lock:
+            self._check_version(version)
+            self._entries[self._next_id] = {
+                "vector": q,
+                "context": self._context_key(chunk_ids, notes),
+                "created": time.monotonic(),
+                "response": response,
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "invalidations": self.invalidations,
+                "collection_version": str(self._version),
+            }
+
+
+def build_answer_cache(cfg: Dict[str, Any]) -> Optional[SemanticAnswerCache]:
+    cache_cfg = cfg.get("cache", {})
+    if not cache_cfg.get("answers_enabled", False):
+        return None
+    return SemanticAnswerCache(
+        similarity_threshold=float(cache_cfg.get("answers_similarity_threshold", 0.92)),
+        ttl_seconds=float(cache_cfg.get("answers_ttl_seconds", 3600)),
+        max_entries=int(cache_cfg.get("answers_max_entries", 1000)),
+    )
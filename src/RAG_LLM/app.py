@@ -1,18 +1,33 @@
 import os
 import json
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-from qdrant_client import QdrantClient
+import asyncio
+import contextlib
+import numpy as np
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from sentence_transformers import SentenceTransformer
 from huggingface_hub import InferenceClient
 import cohere # <-- Added Cohere import
 from dotenv import load_dotenv
-from typing import List, Optional
+from typing import Any, Dict, List, NamedTuple, Optional
+from utils import format_sources, load_config
+from retriever import build_retriever
+from reranker import build_reranker
+from embedding_cache import CachedEncoder, build_query_cache
+from answer_cache import build_answer_cache
+from concurrency import StageLimits, build_cpu_executor, run_blocking
+from batching import build_batcher
+from stream_parser import StepStreamParser
 
 # --- 1. Configuration and Initialization ---
 
 load_dotenv()
 
+CONFIG_PATH = os.getenv("CONFIG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config.yaml"))
+cfg = load_config(CONFIG_PATH)
+
 GENERIC_QUERY_THRESHOLD = 0.25
 
 class QueryRequest(BaseModel):
@@ -36,16 +51,32 @@ app = FastAPI(
 )
 
 qdrant_client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+async_qdrant_client = AsyncQdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
 collection_name = os.getenv("QDRANT_COLLECTION", "xr_rag_server")
-embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+embedding_model = SentenceTransformer(EMBED_MODEL_NAME)
+query_encoder = CachedEncoder(embedding_model, EMBED_MODEL_NAME, build_query_cache(cfg), normalize=True,
+                              batcher=build_batcher(cfg, embedding_model, normalize=True))
+retriever = build_retriever(cfg, CONFIG_PATH, collection_name, qdrant_client=qdrant_client,
+                            async_qdrant_client=async_qdrant_client)
+reranker = build_reranker(cfg)
+RERANK_CANDIDATES = int(cfg.get("retrieval", {}).get("top_k_text", 40))
+answer_cache = build_answer_cache(cfg)
+
+# Encoding, local search and reranking run on this bounded pool; each stage also has its own limit.
+cpu_executor = build_cpu_executor(cfg.get("concurrency", {}))
+stage_limits = StageLimits(cfg.get("concurrency", {}))
+# The micro-batcher already serialises encoder passes on its own thread; capping callers at the
+# embed limit would keep its batches from ever growing past that limit.
+embed_limit = stage_limits.embed if query_encoder.batcher is None else contextlib.nullcontext()
 
 # --- LLM Client Initialization ---
 # Hugging Face Client (Commented Out)
 # hf_client = InferenceClient(token=os.getenv("HF_TOKEN"))
 # LLM_MODEL = "google/gemma-1.1-7b-it"
 
-# Cohere Client (Now Active)
-co = cohere.Client(os.getenv("COHERE_API_KEY"))
+# Cohere Client (Now Active). The async client keeps slow completions from stalling the event loop.
+co = cohere.AsyncClient(os.getenv("COHERE_API_KEY"))
 COHERE_MODEL = "command-r"
 
 SYSTEM_PROMPT = """You are a careful appliance assistant.
@@ -60,39 +91,103 @@ Do not include any text before or after the JSON object. Output only valid JSON.
 
 # --- 3. API Endpoint Definition ---
 
+class RetrievedContext(NamedTuple):
+    query_vector: np.ndarray
+    chunk_ids: List[Any]
+    is_generic: bool
+    context: str
+    sources: List[str]
+    collection_version: Any
+
+
+async def retrieve_context(request: QueryRequest) -> RetrievedContext:
+    async with embed_limit:
+        query_vector = await query_encoder.aencode(request.query, executor=cpu_executor)
+    
+    # Search the configured backend (Qdrant or local FAISS) for relevant context
+    if reranker is not None:
+        # Over-fetch candidates and let the cross-encoder keep only the best top_k for the prompt.
+        async with stage_limits.search:
+            candidates = await retriever.asearch(query_vector, limit=max(request.top_k, RERANK_CANDIDATES),
+                                                 query_text=request.query, executor=cpu_executor)
+        async with stage_limits.rerank:
+            search_results = await run_blocking(cpu_executor, reranker.rerank, request.query, candidates, request.top_k)
+    else:
+        async with stage_limits.search:
+            search_results = await retriever.asearch(query_vector, limit=request.top_k,
+                                                     query_text=request.query, executor=cpu_executor)
+
+    # Decide if the query is generic based on the dense similarity of the BEST result.
+    # (Fused hybrid scores are rank-based, so they can't be compared to the threshold.)
+    best_similarity = max((hit.similarity for hit in search_results if hit.similarity is not None), default=None)
+    is_generic_query = (
+        not search_results or 
+        (best_similarity is not None and best_similarity < GENERIC_QUERY_THRESHOLD)
+    )
+
+    collection_version = None
+    if answer_cache is not None:
+        collection_version = await run_blocking(None, retriever.version)
+
+    context = ""
+    sources = []
+    
+    if is_generic_query:
+        sources = ["General Knowledge"]
+    else:
+        context_chunks = [hit.payload.get("chunk", "") for hit in search_results]
+        sources = format_sources([hit.payload for hit in search_results])
+        manual_context = "\n---\n".join(context_chunks)
+        context = f"Manual Information:\n{manual_context}"
+
+        if request.notes:
+            notes_context = "\n".join(request.notes)
+            context = f"Important Real-Time Scene Notes:\n{notes_context}\n\n---\n\n{context}"
+
+    return RetrievedContext(query_vector, [hit.id for hit in search_results], is_generic_query,
+                            context, sources, collection_version)
+
+
+def cached_answer(request: QueryRequest, ctx: RetrievedContext) -> Optional[XRResponse]:
+    # Near-duplicate question over the same chunks and notes: reuse the stored answer.
+    if answer_cache is None:
+        return None
+    return answer_cache.get(ctx.query_vector, ctx.chunk_ids, request.notes, ctx.collection_version)
+
+
+def user_message_for(request: QueryRequest, ctx: RetrievedContext) -> str:
+    return f"Context:\n{ctx.context if ctx.context else 'No context available.'}\n\nQuestion: {request.query}"
+
+
+def finalize_response(request: QueryRequest, ctx: RetrievedContext, json_response: Dict[str, Any]) -> XRResponse:
+    llm_warnings = json_response.get("warnings", [])
+    if not isinstance(llm_warnings, list):
+        llm_warnings = []
+
+    if ctx.is_generic:
+        final_warnings = ["This is general advice and is not from a specific product manual."]
+    else:
+        final_warnings = llm_warnings
+        if request.notes:
+            final_warnings.append("This response also considers real-time notes provided by the user.")
+    
+    json_response["warnings"] = final_warnings
+    json_response["sources"] = ctx.sources
+    json_response["is_generic"] = ctx.is_generic
+    
+    xr_response = XRResponse(**json_response)
+    if answer_cache is not None:
+        answer_cache.put(ctx.query_vector, ctx.chunk_ids, request.notes, ctx.collection_version, xr_response)
+    return xr_response
+
+
 @app.post("/ask_xr", response_model=XRResponse)
 async def ask_xr_assistant(request: QueryRequest):
     try:
-        query_vector = embedding_model.encode([request.query], normalize_embeddings=True).tolist()
-        
-        # Search Qdrant for relevant context
-        search_results = qdrant_client.search(
-            collection_name=collection_name,
-            query_vector=query_vector[0],
-            limit=request.top_k,
-            with_payload=True
-        )
-
-        # Decide if the query is generic based on the score of the BEST result.
-        is_generic_query = (
-            not search_results or 
-            search_results[0].score < GENERIC_QUERY_THRESHOLD
-        )
-        
-        context = ""
-        sources = []
-        
-        if is_generic_query:
-            sources = ["General Knowledge"]
-        else:
-            context_chunks = [hit.payload.get("chunk", "") for hit in search_results]
-            sources = list(set([hit.payload.get("source", "unknown") for hit in search_results]))
-            manual_context = "\n---\n".join(context_chunks)
-            context = f"Manual Information:\n{manual_context}"
-
-            if request.notes:
-                notes_context = "\n".join(request.notes)
-                context = f"Important Real-Time Scene Notes:\n{notes_context}\n\n---\n\n{context}"
+        ctx = await retrieve_context(request)
+        cached_response = cached_answer(request, ctx)
+        if cached_response is not None:
+            return cached_response
 
         # --- LLM Call Section ---
 
@@ -109,14 +204,15 @@ async def ask_xr_assistant(request: QueryRequest):
         # ============================================
 
         # === Cohere API Call (Now Active) ===
-        user_message = f"Context:\n{context if context else 'No context available.'}\n\nQuestion: {request.query}"
-
-        response = co.chat(
-            model=COHERE_MODEL,
-            message=user_message,
-            preamble=SYSTEM_PROMPT,  # Cohere uses 'preamble' for the system prompt
-            temperature=0.2,
-        )
+        user_message = user_message_for(request, ctx)
+
+        async with stage_limits.llm:
+            response = await co.chat(
+                model=COHERE_MODEL,
+                message=user_message,
+                preamble=SYSTEM_PROMPT,  # Cohere uses 'preamble' for the system prompt
+                temperature=0.2,
+            )
         llm_output = response.text
         # ==================================
 
@@ -124,27 +220,137 @@ async def ask_xr_assistant(request: QueryRequest):
             # The rest of this logic works for both APIs without changes
             cleaned_output = llm_output.strip().replace("```json", "").replace("```", "").strip()
             json_response = json.loads(cleaned_output)
-            
-            llm_warnings = json_response.get("warnings", [])
-            if not isinstance(llm_warnings, list):
-                llm_warnings = []
-
-            if is_generic_query:
-                final_warnings = ["This is general advice and is not from a specific product manual."]
-            else:
-                final_warnings = llm_warnings
-                if request.notes:
-                    final_warnings.append("This response also considers real-time notes provided by the user.")
-            
-            json_response["warnings"] = final_warnings
-            json_response["sources"] = sources
-            json_response["is_generic"] = is_generic_query
-            
-            return XRResponse(**json_response)
+            return finalize_response(request, ctx, json_response)
         except (json.JSONDecodeError, TypeError) as e:
             raise HTTPException(
                 status_code=500, detail=f"Failed to parse LLM response. Error: {e}. Raw output: {llm_output}"
             )
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+
+# --- 4. Streaming Variant ---
+
+async def stream_llm(user_message: str, pieces: asyncio.Queue):
+    """Puts each generated text piece on `pieces`, then None (or the exception if the call failed)."""
+    try:
+        async with stage_limits.llm:
+            async for event in co.chat_stream(
+                model=COHERE_MODEL,
+                message=user_message,
+                preamble=SYSTEM_PROMPT,
+                temperature=0.2,
+            ):
+                if event.event_type == "text-generation":
+                    pieces.put_nowait(event.text)
+        pieces.put_nowait(None)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        pieces.put_nowait(e)
+
+
+async def ask_xr_events(request: QueryRequest):
+    """
+    Yields (event, data) pairs: "goal" and one "step" per instruction as soon as the LLM
+    has finished writing it, then "done" with the full XRResponse (sources, is_generic, warnings).
+    """
+    try:
+        ctx = await retrieve_context(request)
+        cached_response = cached_answer(request, ctx)
+        if cached_response is not None:
+            yield "goal", {"goal": cached_response.goal}
+            for i, step in enumerate(cached_response.steps):
+                yield "step", {"index": i, "step": step}
+            yield "done", cached_response.model_dump()
+            return
+
+        # Generation runs in its own task and holds the LLM slot only while Cohere is writing;
+        # a slow SSE/WebSocket reader drains the queue without keeping the slot.
+        pieces: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(stream_llm(user_message_for(request, ctx), pieces))
+        parser = StepStreamParser()
+        chunks = []
+        step_index = 0
+        try:
+            while True:
+                piece = await pieces.get()
+                if piece is None:
+                    break
+                if isinstance(piece, BaseException):
+                    raise piece
+                chunks.append(piece)
+                for key, value in parser.feed(piece):
+                    if key == "goal":
+                        yield "goal", {"goal": value}
+                    elif key == "steps":
+                        yield "step", {"index": step_index, "step": value}
+                        step_index += 1
+        finally:
+            producer.cancel()
+
+        llm_output = "".join(chunks)
+        cleaned_output = llm_output.strip().replace("```json", "").replace("```", "").strip()
+        try:
+            json_response = json.loads(cleaned_output)
+        except json.JSONDecodeError as e:
+            yield "error", {"detail": f"Failed to parse LLM response. Error: {e}. Raw output: {llm_output}"}
+            return
+        yield "done", finalize_response(request, ctx, json_response).model_dump()
+
+    except Exception as e:
+        yield "error", {"detail": f"An unexpected error occurred: {str(e)}"}
+
+
+@app.post("/ask_xr/stream")
+async def ask_xr_stream(request: QueryRequest):
+    """Server-Sent Events version of /ask_xr."""
+    async def sse():
+        async for event, data in ask_xr_events(request):
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return StreamingResponse(sse(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.websocket("/ws/ask_xr")
+async def ask_xr_ws(websocket: WebSocket):
+    """WebSocket version of /ask_xr/stream: send a QueryRequest as JSON, receive events."""
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                request = QueryRequest(**await websocket.receive_json())
+            except (json.JSONDecodeError, ValidationError, TypeError) as e:
+                # A malformed message only fails that request; the socket stays open
+                await websocket.send_json({"event": "error", "detail": f"Invalid request: {e}"})
+                continue
+            async for event, data in ask_xr_events(request):
+                await websocket.send_json({"event": event, **data})
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "query_embedding_cache": query_encoder.cache.stats(),
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "stage_limits": stage_limits.stats(),
+        "embedding_batcher": query_encoder.batcher.stats() if query_encoder.batcher is not None else None,
+    }
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await co.close()
+    await async_qdrant_client.close()
+    cpu_executor.shutdown(wait=False)
+
+
+@app.post("/cache/invalidate")
+async def invalidate_answer_cache():
+    # Called by ingestion after a re-ingest, for changes the collection fingerprint can't see.
+    await run_blocking(cpu_executor, retriever.refresh, True)
+    if answer_cache is not None:
+        answer_cache.clear()
+    return {"status": "ok"}
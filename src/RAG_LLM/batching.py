@@ -0,0 +1,126 @@
+# Micro-batching queue in front of a SentenceTransformer: concurrent single-query encodes are
+# collected for up to max_wait_ms / max_batch items and run as one batched forward pass.
+import time, queue, asyncio, threading
+from collections import Counter
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Dict
+
+import numpy as np
+
+
+class MicroBatchEncoder:
+    def __init__(self, model, normalize: bool = True, max_batch: int = 32, max_wait_ms: float = 5.0, name: str = "embed"):
+        self.model = model
+        self.normalize = normalize
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self.batch_sizes: Counter = Counter()  # power-of-two buckets -> number of batches
+        self.items = 0
+        self.batches = 0
+        self._thread = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        return fut
+
+    def encode(self, text: str) -> np.ndarray:
+        """Blocking call, for sync handlers running in a worker thread."""
+        return self.submit(text).result()
+
+    async def aencode(self, text: str) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # finish this batch, stop on the next round
+                break
+            batch.append(item)
+        return batch
+
+    @staticmethod
+    def _resolve(fut: Future, result=None, error: BaseException = None):
+        # A caller may have cancelled its future (client disconnect, asyncio task cancelled);
+        # resolving it would raise InvalidStateError and kill the batcher thread.
+        if fut.done():
+            return
+        try:
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [(text, fut) for text, fut in batch if not fut.done()]
+            if not batch:
+                continue
+            try:
+                # Identical strings in one window (e.g. a burst of "Next Video" requests) are encoded once.
+                unique = list(dict.fromkeys(text for text, _ in batch))
+                try:
+                    vecs = self.model.encode(unique, normalize_embeddings=self.normalize, convert_to_numpy=True,
+                                             batch_size=len(unique), show_progress_bar=False)
+                except Exception as e:
+                    for _, fut in batch:
+                        self._resolve(fut, error=e)
+                    continue
+                by_text = {text: np.asarray(v, dtype=np.float32) for text, v in zip(unique, vecs)}
+                for text, fut in batch:
+                    self._resolve(fut, by_text[text])
+                with self._lock:
+                    self.batch_sizes[1 << (len(batch) - 1).bit_length()] += 1
+                    self.items += len(batch)
+                    self.batches += 1
+            except Exception as e:
+                print(f"[Batcher] Batch of {len(batch)} failed: {e!r}")
+                for _, fut in batch:
+                    self._resolve(fut, error=e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": (self.items / self.batches) if self.batches else 0.0,
+                "batch_size_histogram": {f"<={k}": v for k, v in sorted(self.batch_sizes.items())},
+                "queue_depth": self._queue.qsize(),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+    def close(self):
+        self._queue.put(None)
+
+
+def build_batcher(cfg: Dict[str, Any], model, normalize: bool, name: str = "embed"):
+    batch_cfg = cfg.get("embedding_batching", {})
+    if not batch_cfg.get("enabled", False):
+        return None
+    return MicroBatchEncoder(
+        model, normalize=normalize,
+        max_batch=int(batch_cfg.get("max_batch", 32)),
+        max_wait_ms=float(batch_cfg.get("max_wait_ms", 5)),
+        name=name,
+    )
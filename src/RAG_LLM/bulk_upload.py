@@ -0,0 +1,114 @@
+# Bulk Qdrant upserts shared by the ingest scripts: vectors stay in one NumPy array until
+# each batch is serialised, several batches are in flight at once, and failed batches are
+# retried with exponential backoff.
+import time, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from qdrant_client import models
+
+
+class BulkUploader:
+    def __init__(self, client, collection_name: str, batch_size: int = 500, parallel: int = 4,
+                 retries: int = 3, backoff_s: float = 0.5, wait: bool = True):
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = max(1, batch_size)
+        self.parallel = max(1, parallel)
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.wait = wait
+        self._executor = ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="upsert")
+        # Batches running or queued; submit() blocks beyond this so memory stays bounded
+        self._slots = threading.BoundedSemaphore(self.parallel * 2)
+        self._futures = []
+        self._lock = threading.Lock()
+        self._started = None
+        self.points = 0
+        self.batches = 0
+        self.retried = 0
+
+    def _send(self, ids: List[Any], vectors: np.ndarray, payloads: List[Dict[str, Any]]):
+        for attempt in range(self.retries + 1):
+            try:
+                self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=models.Batch(ids=ids, vectors=vectors.tolist(), payloads=payloads),
+                    wait=self.wait,
+                )
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff_s * (2 ** attempt)
+                with self._lock:
+                    self.retried += 1
+                print(f"[Upload] Batch of {len(ids)} failed ({e}); retry {attempt + 1}/{self.retries} in {delay:.1f}s")
+                time.sleep(delay)
+        with self._lock:
+            self.points += len(ids)
+            self.batches += 1
+
+    def _raise_failed(self):
+        pending = []
+        for fut in self._futures:
+            if not fut.done():
+                pending.append(fut)
+            elif fut.exception() is not None:
+                raise fut.exception()
+        self._futures = pending
+
+    def submit(self, ids: Sequence[Any], vectors: np.ndarray, payloads: Sequence[Dict[str, Any]]):
+        """Queues the points in batch_size pieces; returns once they are queued, not uploaded."""
+        if self._started is None:
+            self._started = time.perf_counter()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for i in range(0, len(ids), self.batch_size):
+            self._raise_failed()
+            self._slots.acquire()
+            fut = self._executor.submit(self._send, list(ids[i:i+self.batch_size]), vectors[i:i+self.batch_size],
+                                        list(payloads[i:i+self.batch_size]))
+            fut.add_done_callback(lambda _: self._slots.release())
+            self._futures.append(fut)
+
+    def flush(self) -> Dict[str, Any]:
+        """Waits for every queued batch, re-raises the first failure, and logs throughput."""
+        for fut in self._futures:
+            fut.result()
+        self._futures = []
+        return self.stats(log=True)
+
+    def upload(self, ids: Sequence[Any], vectors: np.ndarray, payloads: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        self.submit(ids, vectors, payloads)
+        return self.flush()
+
+    def stats(self, log: bool = False) -> Dict[str, Any]:
+        elapsed = (time.perf_counter() - self._started) if self._started is not None else 0.0
+        with self._lock:
+            out = {
+                "points": self.points,
+                "batches": self.batches,
+                "retried": self.retried,
+                "seconds": elapsed,
+                "points_per_s": (self.points / elapsed) if elapsed else 0.0,
+            }
+        if log:
+            print(f"[Upload] {out['points']} points in {out['batches']} batches, {elapsed:.1f}s "
+                  f"({out['points_per_s']:.0f} points/s, {self.parallel} in flight, {out['retried']} retries)")
+        return out
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def build_uploader(client, collection_name: str, cfg: Dict[str, Any]) -> BulkUploader:
+    ingest_cfg = cfg.get("ingest", {})
+    return BulkUploader(
+        client, collection_name,
+        batch_size=int(ingest_cfg.get("upsert_batch", 500)),
+        parallel=int(ingest_cfg.get("upsert_parallel", 4)),
+        retries=int(ingest_cfg.get("upsert_retries", 3)),
+        backoff_s=float(ingest_cfg.get("upsert_backoff_s", 0.5)),
+        wait=bool(ingest_cfg.get("upsert_wait", True)),
+    )
@@ -0,0 +1,82 @@
+# Image captioning for ingestion: each captioner is loaded once per process, and captions are
+# cached on disk by (image sha256, model, generation params) so re-ingests don't regenerate them.
+import io, threading
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from PIL import Image
+from transformers import AutoTokenizer, VisionEncoderDecoderModel
+
+from utils import ContentCache, content_key
+
+DEFAULT_CAPTION_MODEL = "nlpconnect/vit-gpt2-image-captioning"
+
+_captioners: Dict[Tuple[str, str], tuple] = {}
+_captioners_lock = threading.Lock()
+
+
+def load_captioner(name: str):
+    if "nlpconnect" in name:
+        from transformers import ViTImageProcessor
+        tok = AutoTokenizer.from_pretrained(name)
+        proc = ViTImageProcessor.from_pretrained(name)
+        model = VisionEncoderDecoderModel.from_pretrained(name)
+        return ("vitgpt2", model, proc, tok)
+    else:
+        from transformers import BlipProcessor, BlipForConditionalGeneration
+        proc = BlipProcessor.from_pretrained(name)
+        model = BlipForConditionalGeneration.from_pretrained(name)
+        return ("blip", model, proc, None)
+
+
+def get_captioner(name: str, device: str):
+    """Process-wide registry: loads (name, device) on first use and returns the same objects after."""
+    with _captioners_lock:
+        if (name, device) not in _captioners:
+            cap_type, model, proc, tok = load_captioner(name)
+            model = model.to(device).eval()
+            _captioners[(name, device)] = (cap_type, model, proc, tok)
+            print(f"[Caption] Loaded '{name}' on {device}")
+        return _captioners[(name, device)]
+
+
+def _generate(captioner, images: List[Image.Image], device: str, max_length: int, num_beams: int) -> List[str]:
+    cap_type, model, proc, tok = captioner
+    with torch.no_grad():
+        if cap_type == "vitgpt2":
+            pixel_values = proc(images=images, return_tensors="pt").pixel_values.to(device)
+            out_ids = model.generate(pixel_values=pixel_values, max_length=max_length, num_beams=num_beams)
+            caps = tok.batch_decode(out_ids, skip_special_tokens=True)
+        else:
+            inputs = proc(images=images, return_tensors="pt").to(device)
+            out_ids = model.generate(**inputs, max_length=max_length, num_beams=num_beams)
+            caps = proc.tokenizer.batch_decode(out_ids, skip_special_tokens=True)
+    return [c.strip() for c in caps]
+
+
+def caption_images(image_bytes_list: List[bytes], model_name: str = DEFAULT_CAPTION_MODEL, device: str = "cpu",
+                   batch_size: int = 8, max_length: int = 64, num_beams: int = 3,
+                   cache: Optional[ContentCache] = None) -> List[str]:
+    """
+    One caption per image, in order. Images already in the cache, or repeated within the list,
+    are not sent to the model.
+    """
+    keys = [content_key(b, model_name, max_length, num_beams) for b in image_bytes_list]
+    known = cache.get_many(keys) if cache is not None else {}
+    todo = {}
+    for k, b in zip(keys, image_bytes_list):
+        if k not in known and k not in todo:
+            todo[k] = b
+
+    if todo:
+        captioner = get_captioner(model_name, device)
+        todo_keys = list(todo)
+        fresh = {}
+        for i in range(0, len(todo_keys), batch_size):
+            batch_keys = todo_keys[i:i+batch_size]
+            images = [Image.open(io.BytesIO(todo[k])).convert("RGB") for k in batch_keys]
+            fresh.update(zip(batch_keys, _generate(captioner, images, device, max_length, num_beams)))
+        if cache is not None:
+            cache.put_many(fresh)
+        known = {**known, **fresh}
+    return [known[k] for k in keys]
@@ -0,0 +1,34 @@
+# Per-stage concurrency limits and a bounded executor for CPU-bound work in the async handlers.
+import asyncio, functools
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_LIMITS = {"embed": 8, "search": 32, "rerank": 4, "llm": 16}
+
+
+class StageLimits:
+    """One asyncio.Semaphore per pipeline stage, sized from the `concurrency:` block."""
+
+    def __init__(self, concurrency_cfg: Dict[str, Any]):
+        self.sizes = {stage: int(concurrency_cfg.get(stage, n)) for stage, n in DEFAULT_LIMITS.items()}
+        self._sems = {stage: asyncio.Semaphore(n) for stage, n in self.sizes.items()}
+
+    def __getattr__(self, stage: str) -> asyncio.Semaphore:
+        try:
+            return self.__dict__["_sems"][stage]
+        except KeyError:
+            raise AttributeError(stage)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        # Semaphore._value is the number of free slots.
+        return {stage: {"limit": self.sizes[stage], "in_use": self.sizes[stage] - sem._value}
+                for stage, sem in self._sems.items()}
+
+
+def build_cpu_executor(concurrency_cfg: Dict[str, Any], name: str = "rag-cpu") -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=int(concurrency_cfg.get("cpu_workers", 4)), thread_name_prefix=name)
+
+
+async def run_blocking(executor: Optional[Executor], fn: Callable, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,104 @@
+# Bounded, size-aware LRU for query embeddings, shared by the RAG endpoints.
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from concurrency import run_blocking
+
+
+def normalize_query_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, bool, str], np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, bool, str]):
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, key: Tuple[str, bool, str], vec: np.ndarray) -> np.ndarray:
+        vec = np.array(vec, dtype=np.float32)
+        vec.setflags(write=False)  # handed out to every caller, so keep it immutable
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = vec
+            self._bytes += vec.nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return vec
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+class CachedEncoder:
+    """Wraps a SentenceTransformer so repeated query strings skip the encoder."""
+
+    def __init__(self, model, model_name: str, cache: QueryEmbeddingCache, normalize: bool = True, batcher=None):
+        self.model = model
+        self.model_name = model_name
+        self.cache = cache
+        self.normalize = normalize
+        self.batcher = batcher  # optional MicroBatchEncoder for cache misses
+
+    def key(self, text: str) -> Tuple[str, bool, str]:
+        return (self.model_name, self.normalize, normalize_query_text(text))
+
+    def encode(self, text: str) -> np.ndarray:
+        key = self.key(text)
+        vec = self.cache.get(key)
+        if vec is None:
+            if self.batcher is not None:
+                vec = self.batcher.encode(key[2])
+            else:
+                vec = self.model.encode([key[2]], normalize_embeddings=self.normalize, convert_to_numpy=True)[0]
+            vec = self.cache.put(key, vec)
+        return vec
+
+    async def aencode(self, text: str, executor=None) -> np.ndarray:
+        key = self.key(text)
+        vec = self.cache.get(key)
+        if vec is None:
+            if self.batcher is not None:
+                vec = await self.batcher.aencode(key[2])
+            else:
+                vec = await run_blocking(executor, self.model.encode, [key[2]],
+                                         normalize_embeddings=self.normalize, convert_to_numpy=True)
+                vec = vec[0]
+            vec = self.cache.put(key, vec)
+        return vec
+
+
+def build_query_cache(cfg: Dict[str, Any]) -> QueryEmbeddingCache:
+    cache_cfg = cfg.get("cache", {})
+    return QueryEmbeddingCache(
+        max_entries=int(cache_cfg.get("query_embeddings_max_entries", 10000)),
+        max_bytes=int(float(cache_cfg.get("query_embeddings_max_mb", 64)) * 1024 * 1024),
+    )
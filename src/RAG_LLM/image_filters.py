@@ -0,0 +1,75 @@
+# Cheap checks run on extracted images before captioning/OCR: size/aspect filtering of
+# bullets and decorative rules, and perceptual-hash dedup of logos and pictograms that
+# repeat on every page.
+import io
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+def image_size(image_bytes: bytes) -> Tuple[int, int]:
+    # PIL only parses the header here; pixels are decoded lazily
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        return img.size
+
+
+def passes_size_filter(width: int, height: int, min_area: int, max_aspect: float) -> bool:
+    if width <= 0 or height <= 0 or width * height < min_area:
+        return False
+    return max(width / height, height / width) <= max_aspect
+
+
+def dhash(image_bytes: bytes) -> int:
+    """64-bit difference hash: survives re-encoding and rescaling, unlike a byte hash."""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        small = img.convert("L").resize((9, 8), Image.LANCZOS)
+    px = np.asarray(small, dtype=np.int16)
+    bits = (px[:, 1:] > px[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class ImageDeduplicator:
+    """
+    Keeps one representative per perceptual hash (within max_distance bits) and records where
+    each duplicate occurred, so the representative's chunks can list every page it appears on.
+    """
+
+    def __init__(self, max_distance: int = 4):
+        self.max_distance = max_distance
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._owners: List[Hashable] = []
+        self.occurrences: Dict[Hashable, List[Dict[str, Any]]] = {}
+        self.duplicates = 0
+
+    def _nearest(self, h: int) -> Optional[int]:
+        n = len(self._owners)
+        if n == 0:
+            return None
+        xor = np.bitwise_xor(self._hashes[:n], np.uint64(h))
+        dist = np.unpackbits(xor.view(np.uint8)).reshape(n, 64).sum(axis=1)
+        i = int(np.argmin(dist))
+        return i if dist[i] <= self.max_distance else None
+
+    def check(self, h: int, owner: Hashable, occurrences: List[Dict[str, Any]]) -> Optional[Hashable]:
+        """
+        Returns the representative's owner if this image is a duplicate, else registers it and
+        returns None. `occurrences` are the places (source/page) this copy appears.
+        """
+        i = self._nearest(h)
+        if i is not None:
+            rep = self._owners[i]
+            self.occurrences[rep].extend(occurrences)
+            self.duplicates += 1
+            return rep
+        n = len(self._owners)
+        if n == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.zeros(n, dtype=np.uint64)])
+        self._hashes[n] = np.uint64(h)
+        self._owners.append(owner)
+        self.occurrences[owner] = list(occurrences)
+        return None
+
+    def shared(self) -> Dict[Hashable, List[Dict[str, Any]]]:
+        """Representatives that were seen more than once, with all their occurrences."""
+        return {k: v for k, v in self.occurrences.items() if len(v) > 1}
@@ -0,0 +1,47 @@
+# Per-collection record of what has been ingested: file (relative to --input) -> content hash
+# and the Qdrant point ids it produced. Lets reruns touch only new, changed and removed files.
+import os, json, uuid
+from typing import Any, Dict, List
+
+from utils import ensure_dir
+
+# Fixed namespace so the same file content always maps to the same point ids.
+POINT_ID_NAMESPACE = uuid.UUID("5b8f2a4e-1c3d-4e6f-9a0b-7c2d1e4f6a8b")
+
+
+def manifest_path(index_dir: str, collection_name: str) -> str:
+    return os.path.join(index_dir, f"{collection_name}.manifest.json")
+
+
+def load_manifest(path: str) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("files", {})
+
+
+def save_manifest(path: str, files: Dict[str, Dict[str, Any]]):
+    ensure_dir(os.path.dirname(path))
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "files": files}, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def point_id(file_key: str, md5: str, locator: str) -> str:
+    """Stable id for a chunk (locator, e.g. "text:3:0") of a file version; changes whenever the file does."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{file_key}|{md5}|{locator}"))
+
+
+def diff_manifest(manifest: Dict[str, Dict[str, Any]], current: Dict[str, str], force: bool = False):
+    """
+    Compares the manifest with {file_key: md5} of the files on disk. Returns the keys to
+    (re)process, the removed keys, and the point ids that must be deleted (changed + removed).
+    With force, every file on disk counts as changed.
+    """
+    changed = sorted(k for k, md5 in current.items() if force or manifest.get(k, {}).get("md5") != md5)
+    removed = sorted(k for k in manifest if k not in current)
+    stale_ids: List[str] = []
+    for k in changed + removed:
+        stale_ids.extend(manifest.get(k, {}).get("point_ids", []))
+    return changed, removed, stale_ids
@@ -0,0 +1,91 @@
+# File parsing for ingest_qdrant_cloud.py, kept apart so its worker processes stay light:
+# with spawn (the Windows default) every worker re-imports the module its target lives in,
+# and this one only pulls in utils/PyMuPDF, not torch, transformers or EasyOCR.
+import os, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from utils import chunk_text, infer_metadata_from_filename, iter_pdf_pages, load_text_from_html, load_text_from_plain
+
+SUPPORTED_IMG_EXT = {".png", ".jpg", ".jpeg", ".webp"}
+SUPPORTED_TEXT_EXT = {".txt", ".md", ".markdown", ".html", ".htm"}
+SUPPORTED_PDF_EXT = {".pdf"}
+
+
+def parse_file(path: str, file_key: str, md5: str, min_tokens: int, max_tokens: int) -> Dict[str, Any]:
+    """
+    Parses and chunks one input file. Top-level (picklable) so it can run in a worker process.
+    PDFs are chunked page by page, so every chunk knows its page. OCR is not done here:
+    images on pages without a text layer come back flagged in image_needs_ocr, and the
+    parent OCRs them with its pooled readers.
+    """
+    started = time.perf_counter()
+    ext = os.path.splitext(path)[1].lower()
+    meta = {**infer_metadata_from_filename(path), "file_key": file_key, "file_md5": md5}
+    text_chunks, text_meta = [], []
+    image_bytes_list, image_meta = [], []
+    image_needs_ocr = []
+
+    if ext in SUPPORTED_TEXT_EXT:
+        text = load_text_from_html(path) if ext in {".html", ".htm"} else load_text_from_plain(path)
+        for c in chunk_text(text, min_tokens, max_tokens):
+            text_chunks.append(c)
+            text_meta.append({"source": path, **meta})
+
+    elif ext in SUPPORTED_PDF_EXT:
+        pages_of = {}  # xref -> every page the image appears on
+        image_xrefs = []
+        for page in iter_pdf_pages(path):
+            for c in chunk_text(page["text"], min_tokens, max_tokens):
+                text_chunks.append(c)
+                text_meta.append({"source": path, "page": page["page"], **meta})
+            for xref in page["image_xrefs"]:
+                pages_of.setdefault(xref, []).append(page["page"])
+            for im in page["images"]:
+                image_bytes_list.append(im["image_bytes"])
+                image_meta.append({"source": path, "page": im["page"], **meta})
+                image_xrefs.append(im["xref"])
+                image_needs_ocr.append(not page["text"].strip())
+        for m, xref in zip(image_meta, image_xrefs):
+            if len(pages_of[xref]) > 1:
+                m["occurrences"] = [{"source": path, "page": p} for p in pages_of[xref]]
+
+    elif ext in SUPPORTED_IMG_EXT:
+        with open(path, "rb") as f:
+            b = f.read()
+        image_bytes_list.append(b)
+        image_meta.append({"source": path, **meta})
+        image_needs_ocr.append(False)
+
+    return {
+        "file_key": file_key,
+        "text_chunks": text_chunks,
+        "text_meta": text_meta,
+        "image_bytes": image_bytes_list,
+        "image_meta": image_meta,
+        "image_needs_ocr": image_needs_ocr,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _parse_file_args(args):
+    return parse_file(*args)
+
+
+def parse_files(jobs: List[Tuple[str, str, str, int, int]], workers: int):
+    """Yields parse_file results in the order of jobs, fanning out to worker processes when workers > 1."""
+    if workers <= 1:
+        yield from map(_parse_file_args, jobs)
+        return
+    # Executor.map would submit every job up front and buffer all results (image bytes included)
+    # while the pipeline is slower than parsing; keep at most `window` files in flight instead
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for job in jobs:
+            pending.append(pool.submit(_parse_file_args, job))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,117 @@
+# Bounded-memory ingestion: a source generator feeds a chain of stages, one thread each,
+# joined by bounded queues. Every stage works on its own batch size, so e.g. captioning,
+# embedding and uploading overlap instead of each waiting for the whole corpus.
+import time, queue, threading
+from typing import Any, Callable, Iterable, List, Optional
+
+_DONE = object()
+
+
+class _Aborted(Exception):
+    pass
+
+
+class Stage:
+    """fn(batch) -> iterable of items for the next stage (the last stage's output is dropped)."""
+
+    def __init__(self, name: str, fn: Callable[[List[Any]], Optional[Iterable[Any]]], batch_size: int = 1):
+        self.name = name
+        self.fn = fn
+        self.batch_size = max(1, int(batch_size))
+        self.items_in = 0
+        self.items_out = 0
+        self.batches = 0
+        self.busy_s = 0.0
+        self.first_output_s = None
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], queue_size: int = 256):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self._stop = threading.Event()
+        self._errors = []
+        self.source_items = 0
+
+    def _put(self, q: queue.Queue, item):
+        while True:
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                if self._stop.is_set():
+                    raise _Aborted()
+
+    def _get(self, q: queue.Queue):
+        while True:
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                if self._stop.is_set():
+                    raise _Aborted()
+
+    def _fail(self, name: str, e: BaseException):
+        if not isinstance(e, _Aborted):
+            print(f"[Pipeline] Stage '{name}' failed: {e!r}")
+            self._errors.append(e)
+        self._stop.set()
+
+    def _run_source(self, source: Iterable[Any]):
+        try:
+            for item in source:
+                self._put(self.queues[0], item)
+                self.source_items += 1
+            self._put(self.queues[0], _DONE)
+        except BaseException as e:
+            self._fail("source", e)
+
+    def _run_stage(self, i: int, started: float):
+        stage = self.stages[i]
+        inbox = self.queues[i]
+        outbox = self.queues[i + 1] if i + 1 < len(self.stages) else None
+        try:
+            done = False
+            while not done:
+                # Fill a whole batch (or flush what's left at the end of the stream)
+                batch = []
+                while len(batch) < stage.batch_size:
+                    item = self._get(inbox)
+                    if item is _DONE:
+                        done = True
+                        break
+                    batch.append(item)
+                if not batch:
+                    continue
+                t0 = time.perf_counter()
+                out = list(stage.fn(batch) or [])
+                stage.busy_s += time.perf_counter() - t0
+                stage.items_in += len(batch)
+                stage.batches += 1
+                if out and stage.first_output_s is None:
+                    stage.first_output_s = time.perf_counter() - started
+                stage.items_out += len(out)
+                if outbox is not None:
+                    for item in out:
+                        self._put(outbox, item)
+            if outbox is not None:
+                self._put(outbox, _DONE)
+        except BaseException as e:
+            self._fail(stage.name, e)
+
+    def run(self, source: Iterable[Any]):
+        """Runs to completion; re-raises the first stage error after every thread has stopped."""
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._run_source, args=(source,), name="pipeline-source", daemon=True)]
+        threads += [threading.Thread(target=self._run_stage, args=(i, started), name=f"pipeline-{s.name}", daemon=True)
+                    for i, s in enumerate(self.stages)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        for s in self.stages:
+            first = f", first output after {s.first_output_s:.2f}s" if s.first_output_s is not None else ""
+            print(f"[Pipeline] {s.name}: {s.items_in} in / {s.items_out} out in {s.batches} batches "
+                  f"(batch {s.batch_size}), busy {s.busy_s:.2f}s of {elapsed:.2f}s{first}")
+        if self._errors:
+            raise self._errors[0]
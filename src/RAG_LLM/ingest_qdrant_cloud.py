@@ -1,17 +1,24 @@
-import os, io, json, argparse, yaml, numpy as np
-from typing import Dict, Any, List, Set, Tuple
+import os, io, json, time, argparse, numpy as np
+from typing import Dict, Any, List, Tuple
 from tqdm import tqdm
+import requests
 
 import torch
 from PIL import Image
 
 from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, VisionEncoderDecoderModel
 
 from qdrant_client import QdrantClient, models
 from dotenv import load_dotenv
 from utils import *
-from ocr import ocr_image_bytes
+from ocr import ocr_images
+from captioning import DEFAULT_CAPTION_MODEL, caption_images, get_captioner
+from image_filters import ImageDeduplicator, dhash, image_size, passes_size_filter
+from retriever import update_local_indexes
+from ingest_manifest import manifest_path, load_manifest, save_manifest, point_id, diff_manifest
+from ingest_pipeline import Pipeline, Stage
+from ingest_parse import SUPPORTED_IMG_EXT, SUPPORTED_PDF_EXT, SUPPORTED_TEXT_EXT, parse_files
+from bulk_upload import build_uploader
 
 load_dotenv()
 
@@ -27,41 +34,6 @@ MIN_CHUNK_TOKENS = int(os.getenv("MIN_CHUNK_TOKENS", 50))
 MAX_CHUNK_TOKENS = int(os.getenv("MAX_CHUNK_TOKENS", 150))
 STORE_IMAGES = os.getenv("STORE_IMAGES", "false").lower() == "true"
 
-def load_captioner(name: str):
-    if "nlpconnect" in name:
-        from transformers import ViTImageProcessor
-        tok = AutoTokenizer.from_pretrained(name)
-        proc = ViTImageProcessor.from_pretrained(name)
-        model = VisionEncoderDecoderModel.from_pretrained(name)
-        return ("vitgpt2", model, proc, tok)
-    else:
-        from transformers import BlipProcessor, BlipForConditionalGeneration
-        proc = BlipProcessor.from_pretrained(name)
-        model = BlipForConditionalGeneration.from_pretrained(name)
-        return ("blip", model, proc, None)
-
-
-def caption_images(image_bytes_list: List[bytes], caption_cfg: Dict[str, Any], batch_size: int = 8) -> List[str]:
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    cap_type, model, proc, tok = load_captioner(caption_cfg["caption_model"])
-    model = model.to(device)
-    captions = []
-    for i in range(0, len(image_bytes_list), batch_size):
-        batch = image_bytes_list[i:i+batch_size]
-        images = [Image.open(io.BytesIO(b)).convert("RGB") for b in batch]
-        with torch.no_grad():
-            if cap_type == "vitgpt2":
-                pixel_values = proc(images=images, return_tensors="pt").pixel_values.to(device)
-                out_ids = model.generate(pixel_values=pixel_values, max_length=64, num_beams=3)
-                caps = tok.batch_decode(out_ids, skip_special_tokens=True)
-            else:
-                inputs = proc(images=images, return_tensors="pt").to(device)
-                out_ids = model.generate(**inputs, max_length=64, num_beams=3)
-                caps = proc.tokenizer.batch_decode(out_ids, skip_special_tokens=True)
-        captions.extend([c.strip() for c in caps])
-    return captions
-
-
 def embed_texts(texts: List[str], st_model: SentenceTransformer, batch_size: int = 64) -> np.ndarray:
     vecs = []
     for i in range(0, len(texts), batch_size):
@@ -71,64 +43,60 @@ def embed_texts(texts: List[str], st_model: SentenceTransformer, batch_size: int
     return np.vstack(vecs).astype(np.float32, copy=False) if vecs else np.zeros((0, st_model.get_sentence_embedding_dimension()), dtype=np.float32)
 
 
-def embed_shared_encoder_text_and_images(text_chunks: List[str], image_bytes_list: List[bytes], shared_model_name: str) -> tuple[np.ndarray, int]:
-    model = SentenceTransformer(shared_model_name)
-    text_vecs = model.encode(text_chunks, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32, copy=False) if text_chunks else np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+def embed_images(image_bytes_list: List[bytes], model: SentenceTransformer) -> np.ndarray:
     imgs = [Image.open(io.BytesIO(b)).convert("RGB") for b in image_bytes_list]
-    img_vecs = model.encode(imgs, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32, copy=False) if imgs else np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
-    all_vecs = np.vstack([text_vecs, img_vecs]).astype(np.float32, copy=False) if text_vecs.shape[0] + img_vecs.shape[0] > 0 else np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
-    return all_vecs, model.get_sentence_embedding_dimension()
-
-
-def merge_modalities_to_text_chunks(
-    text_chunks: List[str],
-    text_meta: List[Dict[str, Any]],
-    image_bytes_list: List[bytes],
-    image_meta: List[Dict[str, Any]],
-    caption_cfg: Dict[str, Any],
-    use_ocr: bool,
-    langs: List[str],
-    min_tokens: int,
-    max_tokens: int,
-    ocr_already_in_text: Set[Tuple[str, int]] | None = None,
-):
-    merged_chunks = []
-    merged_meta = []
-
-    captions = caption_images(image_bytes_list, caption_cfg) if image_bytes_list else []
-    ocr_seen = ocr_already_in_text or set()
-
-    for i, m in enumerate(image_meta):
-        cap_text = captions[i] if captions else ""
-        ocr_text = ""
-        key = (m.get("source"), int(m.get("page", -1)))
-        if use_ocr and key not in ocr_seen:
-            ocr_text = ocr_image_bytes(image_bytes_list[i], languages=langs)
-        merged_text_parts = []
-        if cap_text.strip():
-            merged_text_parts.append(f"[Image Caption]: {cap_text}")
-        if ocr_text.strip():
-            merged_text_parts.append(f"[Image Text]: {ocr_text}")
-        if merged_text_parts:
-            merged_text = "\n".join(merged_text_parts)
-            for c in chunk_text(merged_text, min_tokens, max_tokens):
-                merged_chunks.append(c)
-                merged_meta.append({"chunk": c, "type": "image_info", **m})
-
-    for c, m in zip(text_chunks, text_meta):
-        merged_chunks.append(c)
-        merged_meta.append({"chunk": c, "type": "text", **m})
-
-    return merged_chunks, merged_meta
+    if not imgs:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return model.encode(imgs, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32, copy=False)
+
+
+def image_info_chunks(caption: str, ocr_text: str, min_tokens: int, max_tokens: int) -> List[str]:
+    merged_text_parts = []
+    if caption.strip():
+        merged_text_parts.append(f"[Image Caption]: {caption}")
+    if ocr_text.strip():
+        merged_text_parts.append(f"[Image Text]: {ocr_text}")
+    if not merged_text_parts:
+        return []
+    return chunk_text("\n".join(merged_text_parts), min_tokens, max_tokens)
+
+
+def parsed_items(jobs: List[Tuple[str, str, str, int, int]], workers: int):
+    """
+    Flattens parse results into pipeline items, file by file, so only the files currently in
+    flight are held in memory. Each item carries a locator that is unique within its file and
+    doesn't depend on batching, which makes the point ids reproducible.
+    """
+    parse_started = time.perf_counter()
+    timings = []
+    for parsed in parse_files(jobs, workers):
+        for n, (c, m) in enumerate(zip(parsed["text_chunks"], parsed["text_meta"])):
+            yield {"kind": "text", "chunk": c, "meta": m, "locator": f"text:{n}"}
+        for n, (b, m, needs_ocr) in enumerate(zip(parsed["image_bytes"], parsed["image_meta"], parsed["image_needs_ocr"])):
+            if needs_ocr:
+                # scanned page: the page text comes from OCR, so don't OCR the image twice
+                yield {"kind": "ocr", "image_bytes": b, "meta": m, "locator": f"ocr:{n}"}
+            yield {"kind": "image", "image_bytes": b, "meta": m, "locator": f"image:{n}",
+                   "skip_ocr": needs_ocr}
+        timings.append((parsed["seconds"], parsed["file_key"]))
+        print(f"[Ingest] Parsed {parsed['file_key']} in {parsed['seconds']:.2f}s "
+              f"({len(parsed['text_chunks'])} chunks, {len(parsed['image_bytes'])} images)")
+    parse_wall = time.perf_counter() - parse_started
+    parse_cpu = sum(t for t, _ in timings)
+    print(f"[Ingest] Parsed {len(jobs)} files in {parse_wall:.2f}s wall / {parse_cpu:.2f}s total "
+          f"with {workers} worker(s); slowest: "
+          + ", ".join(f"{k} {t:.2f}s" for t, k in sorted(timings, reverse=True)[:3]))
 
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--input", required=True, help="Folder with PDFs, images, txt/md/html")
     ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--force", action="store_true", help="Re-process every file, ignoring the manifest")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for parsing files (1 = in-process)")
     args = ap.parse_args()
 
-    cfg = yaml.safe_load(open(args.config))
+    cfg = load_config(args.config)
 
     # Qdrant cloud setup
     QDRANT_URL = os.getenv("QDRANT_URL")
@@ -143,98 +111,232 @@ def main():
     min_tokens = int(cfg["index"].get("min_chunk_tokens", 50))
     max_tokens = int(cfg["index"].get("max_chunk_tokens", 150))
 
-    # Gather corpus
-    text_chunks, text_meta = [], []
-    image_bytes_list, image_meta = [], []
+    supported_ext = SUPPORTED_IMG_EXT | SUPPORTED_TEXT_EXT | SUPPORTED_PDF_EXT
 
-    supported_img_ext = {".png", ".jpg", ".jpeg", ".webp"}
-    supported_text_ext = {".txt", ".md", ".markdown", ".html", ".htm"}
-    supported_pdf_ext = {".pdf"}
+    # Compare the input folder with the manifest of the last run: only new/changed files are
+    # parsed and embedded; points of changed and removed files are deleted afterwards.
+    index_dir = resolve_config_path(args.config, cfg["index"].get("local_dir", "indexes"))
+    manifest_file = manifest_path(index_dir, QDRANT_COLLECTION)
+    manifest = load_manifest(manifest_file)
+    if not manifest and client.collection_exists(QDRANT_COLLECTION):
+        print(f"[Ingest] No manifest at {manifest_file}; points from earlier runs without one "
+              f"are not tracked and will not be replaced (recreate '{QDRANT_COLLECTION}' to start clean)")
 
+    input_files = {}
     for root, _, files in os.walk(args.input):
         for fn in files:
-            path = os.path.join(root, fn)
-            ext = os.path.splitext(fn)[1].lower()
-            meta = infer_metadata_from_filename(path)
-
-            if ext in supported_text_ext:
-                text = load_text_from_html(path) if ext in {".html", ".htm"} else load_text_from_plain(path)
-                for c in chunk_text(text, min_tokens, max_tokens):
-                    text_chunks.append(c)
-                    text_meta.append({"source": path, **meta})
-
-            elif ext in supported_pdf_ext:
-                text, images = load_text_from_pdf(path)
-                for c in chunk_text(text, min_tokens, max_tokens):
-                    text_chunks.append(c)
-                    text_meta.append({"source": path, **meta})
-                for im in images:
-                    image_bytes_list.append(im["image_bytes"])
-                    image_meta.append({"source": path, "page": im["page"], **meta})
-                if use_ocr and not text.strip():
-                    for im in images:
-                        ocr_text = ocr_image_bytes(im["image_bytes"], languages=langs)
-                        if ocr_text.strip():
-                            for c in chunk_text(ocr_text, min_tokens, max_tokens):
-                                text_chunks.append(c)
-                                text_meta.append({"source": path, "page": im["page"], "ocr": True, **meta})
-
-            elif ext in supported_img_ext:
-                with open(path, "rb") as f:
-                    b = f.read()
-                image_bytes_list.append(b)
-                image_meta.append({"source": path, **meta})
-
-    print(f"[Ingest] Found text chunks: {len(text_chunks)} | images: {len(image_bytes_list)}")
-
-    # Build embeddings
-    if strategy == "caption_to_text":
-        caption_cfg = {"caption_model": cfg["index"].get("caption_model", "nlpconnect/vit-gpt2-image-captioning")}
-        ocr_already_in_text = {(m.get("source"), int(m.get("page", -1))) for m in text_meta if m.get("ocr") is True}
-        merged_chunks, merged_meta = merge_modalities_to_text_chunks(
-            text_chunks, text_meta, image_bytes_list, image_meta, caption_cfg,
-            use_ocr, langs, min_tokens, max_tokens, ocr_already_in_text=ocr_already_in_text
-        )
-        print(f"[Ingest] Total merged chunks for embedding: {len(merged_chunks)}")
-        st_model = SentenceTransformer(text_model_name)
-        vectors = embed_texts(merged_chunks, st_model)
-        all_meta = merged_meta
+            if os.path.splitext(fn)[1].lower() in supported_ext:
+                path = os.path.join(root, fn)
+                input_files[os.path.relpath(path, args.input).replace(os.sep, "/")] = path
+    current = {key: file_md5(path) for key, path in input_files.items()}
+    changed, removed, stale_ids = diff_manifest(manifest, current, force=args.force)
+    print(f"[Ingest] {len(current)} files: {len(changed)} new/changed, {len(removed)} removed, "
+          f"{len(current) - len(changed)} unchanged")
+    if not changed and not removed:
+        print("[Ingest] Nothing to do.")
+        # ...except building a local index that doesn't exist yet
+        update_local_indexes(client, QDRANT_COLLECTION, index_dir, cfg, full=args.force)
+        return
+
+    ingest_cfg = cfg.get("ingest", {})
+    upsert_batch = int(ingest_cfg.get("upsert_batch", 500))
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    # Captions/OCR text computed on earlier runs, keyed by image content
+    cache_path = resolve_config_path(args.config, ingest_cfg.get("cache_path", "indexes/content_cache.sqlite"))
+    caption_cache = ContentCache(cache_path, "caption")
+    ocr_cache = ContentCache(cache_path, "ocr")
+    ocr_workers = int(ingest_cfg.get("ocr_workers", 2))
 
+    if strategy == "caption_to_text":
+        caption_model = cfg["index"].get("caption_model", DEFAULT_CAPTION_MODEL)
+        get_captioner(caption_model, device)  # load once, before the pipeline starts
+        embed_model = SentenceTransformer(text_model_name)
     elif strategy == "shared_encoder":
         shared_model_name = cfg["index"]["shared_encoder_model"]
         if not shared_model_name:
             raise ValueError("Set index.shared_encoder_model in config when using shared_encoder")
-        vectors, _ = embed_shared_encoder_text_and_images(text_chunks, image_bytes_list, shared_model_name)
-        all_meta = [{"type": "text", **m} for m in text_meta] + [{"type": "image", **m} for m in image_meta]
-
+        caption_model = None
+        embed_model = SentenceTransformer(shared_model_name)
     else:
         raise ValueError(f"Unknown strategy: {strategy}")
-
-    print(f"[Ingest] Final vectors: {vectors.shape[0]} x {vectors.shape[1]}")
+    dim = embed_model.get_sentence_embedding_dimension()
 
     # Ensure Qdrant collection exists
-    try:
-        client.get_collection(QDRANT_COLLECTION)
-    except Exception:
-        client.recreate_collection(
+    if not client.collection_exists(QDRANT_COLLECTION):
+        client.create_collection(
             collection_name=QDRANT_COLLECTION,
-            vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE)
+            vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE)
         )
 
-    # Upsert into Qdrant in batches
-    BATCH_SIZE = 500
-    
-    # points = [PointStruct(vector=v.tolist(), payload=m) for v, m in zip(vectors, merged_meta)]
-    
-    points = [models.PointStruct(id=i, vector=v.tolist(), payload=m) for i, (v, m) in enumerate(zip(vectors, merged_meta))]
-
-    BATCH_SIZE = 500
-    for i in range(0, len(points), BATCH_SIZE):
-        client.upsert(
+    # Streaming pipeline: parse -> image filter -> caption/OCR -> embed -> upsert,
+    # bounded queues in between
+    def item_id(it, k: int) -> str:
+        m = it["meta"]
+        return point_id(m["file_key"], m["file_md5"], f"{it['locator']}:{k}")
+
+    min_area = int(ingest_cfg.get("image_min_area", 4096))
+    max_aspect = float(ingest_cfg.get("image_max_aspect", 8.0))
+    use_dedup = bool(ingest_cfg.get("image_dedup", True))
+    dedup_max_distance = int(ingest_cfg.get("image_dedup_max_distance", 4))
+    # Dedup within each file only: a representative's points belong to its own file's manifest
+    # entry, so a cross-file duplicate would lose its caption once the other file changed.
+    # Byte-identical images in other files still hit the caption/OCR cache.
+    dedups: Dict[str, ImageDeduplicator] = {}
+    num_beams = int(ingest_cfg.get("caption_num_beams", 3))
+    filtered = {"small": 0, "unreadable": 0}
+    emitted_ids = {}  # (file_key, locator) of each image -> its point ids, for shared occurrences
+
+    def image_filter_stage(batch):
+        """Drops tiny/extreme-aspect images and perceptual duplicates; everything else passes."""
+        out = []
+        for it in batch:
+            if it["kind"] != "image":
+                out.append(it)
+                continue
+            try:
+                w, h = image_size(it["image_bytes"])
+                if not passes_size_filter(w, h, min_area, max_aspect):
+                    filtered["small"] += 1
+                    continue
+                if use_dedup:
+                    m = it["meta"]
+                    dedup = dedups.setdefault(m["file_key"], ImageDeduplicator(dedup_max_distance))
+                    occurrences = m.get("occurrences") or [{"source": m.get("source"), "page": m.get("page")}]
+                    if dedup.check(dhash(it["image_bytes"]), (m["file_key"], it["locator"]), occurrences) is not None:
+                        continue
+            except Exception:
+                filtered["unreadable"] += 1
+                continue
+            out.append(it)
+        return out
+
+    def caption_stage(batch):
+        """Turns parsed items into text to embed (or, for shared_encoder, images to embed)."""
+        images = [it for it in batch if it["kind"] == "image"] if caption_model is not None else []
+        captions = caption_images([it["image_bytes"] for it in images], caption_model, device,
+                                  num_beams=num_beams, cache=caption_cache) if images else []
+        caption_of = {id(it): c for it, c in zip(images, captions)}
+        # One OCR call for the whole batch: scanned pages, plus images when captioning
+        to_ocr = [it for it in batch if use_ocr and (it["kind"] == "ocr" or
+                  (it["kind"] == "image" and caption_model is not None and not it["skip_ocr"]))]
+        ocr_texts = ocr_images([it["image_bytes"] for it in to_ocr], langs, workers=ocr_workers,
+                               cache=ocr_cache) if to_ocr else []
+        ocr_of = {id(it): t for it, t in zip(to_ocr, ocr_texts)}
+        out = []
+        for it in batch:
+            m = it["meta"]
+            ocr_text = ocr_of.get(id(it), "")
+            if it["kind"] == "text":
+                out.append({"id": item_id(it, 0), "text": it["chunk"], "payload": {"chunk": it["chunk"], "type": "text", **m}})
+            elif it["kind"] == "ocr":
+                for k, c in enumerate(chunk_text(ocr_text, min_tokens, max_tokens) if ocr_text.strip() else []):
+                    out.append({"id": item_id(it, k), "text": c, "payload": {"chunk": c, "type": "text", **m, "ocr": True}})
+            elif caption_model is None:
+                out.append({"id": item_id(it, 0), "image": it["image_bytes"], "payload": {"type": "image", **m}})
+                emitted_ids[(m["file_key"], it["locator"])] = [out[-1]["id"]]
+            else:
+                ids = emitted_ids[(m["file_key"], it["locator"])] = []
+                for k, c in enumerate(image_info_chunks(caption_of[id(it)], ocr_text, min_tokens, max_tokens)):
+                    out.append({"id": item_id(it, k), "text": c, "payload": {"chunk": c, "type": "image_info", **m}})
+                    ids.append(out[-1]["id"])
+        return out
+
+    def embed_stage(batch):
+        texts = [it for it in batch if "text" in it]
+        images = [it for it in batch if "image" in it]
+        out = []
+        if texts:
+            vecs = embed_texts([it["text"] for it in texts], embed_model, batch_size=len(texts))
+            out.extend((it["id"], v, it["payload"]) for it, v in zip(texts, vecs))
+        if images:
+            vecs = embed_images([it["image"] for it in images], embed_model)
+            out.extend((it["id"], v, it["payload"]) for it, v in zip(images, vecs))
+        return out
+
+    new_ids_by_file = {key: [] for key in changed}
+    uploader = build_uploader(client, QDRANT_COLLECTION, cfg)
+    # This run's points, applied to the local FAISS/BM25 indexes at the end (vectors only for FAISS)
+    keep_vectors = cfg.get("retrieval", {}).get("backend") == "faiss"
+    added_ids, added_vectors, added_payloads = [], [], []
+
+    def upsert_stage(batch):
+        # Hands the batch to the uploader's in-flight pool; blocks only when it is saturated
+        vectors = np.stack([v for _, v, _ in batch])
+        uploader.submit([pid for pid, _, _ in batch], vectors, [m for _, _, m in batch])
+        for pid, _, m in batch:
+            new_ids_by_file[m["file_key"]].append(pid)
+            added_ids.append(pid)
+            added_payloads.append(m)
+        if keep_vectors:
+            added_vectors.append(vectors)
+
+    pipeline = Pipeline([
+        Stage("image_filter", image_filter_stage, ingest_cfg.get("caption_batch", 8)),
+        Stage("caption_ocr", caption_stage, ingest_cfg.get("caption_batch", 8)),
+        Stage("embed", embed_stage, ingest_cfg.get("embed_batch", 64)),
+        Stage("upsert", upsert_stage, upsert_batch),
+    ], queue_size=int(ingest_cfg.get("queue_size", 256)))
+
+    # Parse in worker processes; results come back in sorted file order
+    jobs = [(input_files[key], key, current[key], min_tokens, max_tokens) for key in changed]
+    try:
+        pipeline.run(parsed_items(jobs, args.workers))
+        upload_stats = uploader.flush()
+    finally:
+        uploader.close()
+    print(f"[Ingest] Final vectors: {upload_stats['points']} x {dim}")
+
+    # Repeated images were captioned once; their chunks list every page they appear on
+    shared = {rep: occ for dedup in dedups.values() for rep, occ in dedup.shared().items()}
+    for rep, occurrences in shared.items():
+        if emitted_ids.get(rep):
+            client.set_payload(collection_name=QDRANT_COLLECTION, payload={"occurrences": occurrences},
+                               points=emitted_ids[rep])
+    print(f"[Ingest] Images skipped: {filtered['small']} too small/thin, {filtered['unreadable']} unreadable, "
+          f"{sum(d.duplicates for d in dedups.values())} duplicates of {len(shared)} repeated images")
+    if caption_model is not None:
+        cs = caption_cache.stats()
+        print(f"[Ingest] Caption cache: {cs['hits']} hits / {cs['misses']} misses ({cs['hit_rate']:.0%} hit rate)")
+    if use_ocr:
+        ocs = ocr_cache.stats()
+        print(f"[Ingest] OCR cache: {ocs['hits']} hits / {ocs['misses']} misses ({ocs['hit_rate']:.0%} hit rate)")
+
+    # New versions are in; now drop the points of changed and removed files
+    new_ids = {pid for ids in new_ids_by_file.values() for pid in ids}
+    # Local indexes drop every old point of these files, and any earlier copy of a re-upserted one
+    index_remove_ids = list(set(stale_ids) | new_ids)
+    stale_ids = [pid for pid in stale_ids if pid not in new_ids]
+    for i in range(0, len(stale_ids), upsert_batch):
+        client.delete(
             collection_name=QDRANT_COLLECTION,
-            points=points[i:i+BATCH_SIZE]
+            points_selector=models.PointIdsList(points=stale_ids[i:i+upsert_batch]),
         )
-        print(f"Uploaded {min(i+BATCH_SIZE,len(points))}/{len(points)} points")
+    if stale_ids:
+        print(f"[Ingest] Deleted {len(stale_ids)} stale points")
+
+    files = {k: v for k, v in manifest.items() if k not in removed}
+    for key in changed:
+        files[key] = {"md5": current[key], "point_ids": new_ids_by_file[key]}
+    save_manifest(manifest_file, files)
+    print(f"[Ingest] Manifest saved: {manifest_file}")
+
+    # Apply this run to the local FAISS index (in-process retrieval) and BM25 index (hybrid
+    # retrieval) instead of re-exporting the collection; --force rebuilds them from scratch
+    update_local_indexes(
+        client, QDRANT_COLLECTION, index_dir, cfg,
+        remove_ids=index_remove_ids, add_ids=added_ids, add_payloads=added_payloads,
+        add_vectors=np.vstack(added_vectors) if added_vectors else None, full=args.force,
+    )
+
+    # Drop answers the running /ask_xr servers cached from the previous contents
+    invalidate_urls = [u for u in os.getenv("ANSWER_CACHE_INVALIDATE_URLS", "").split(",") if u.strip()]
+    for url in invalidate_urls:
+        try:
+            requests.post(url.strip(), timeout=5).raise_for_status()
+            print(f"[Ingest] Invalidated answer cache at {url}")
+        except requests.exceptions.RequestException as e:
+            print(f"[Ingest] Could not invalidate answer cache at {url}: {e}")
 
 
 if __name__ == "__main__":
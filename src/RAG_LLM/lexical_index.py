@@ -0,0 +1,105 @@
+# BM25 inverted index over the ingested chunks, for exact tokens (model numbers, error codes)
+# that dense embeddings tend to blur.
+import os, re, json, math
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Sequence, Tuple
+
+from utils import ensure_dir
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compound codes like "wfw-9620" are kept whole *and* split."""
+    tokens = []
+    for tk in TOKEN_RE.findall(text.lower()):
+        tokens.append(tk)
+        parts = re.split(r"[-./]", tk)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+def lexical_index_path(index_dir: str, collection_name: str) -> str:
+    return os.path.join(index_dir, f"{collection_name}.bm25.json")
+
+
+class BM25Index:
+    def __init__(self, ids: List[Any], payloads: List[Dict[str, Any]], doc_lens: List[int],
+                 postings: Dict[str, List[Tuple[int, int]]], k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.payloads = payloads
+        self.doc_lens = doc_lens
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avgdl = (sum(doc_lens) / len(doc_lens)) if doc_lens else 0.0
+
+    @classmethod
+    def build(cls, ids: Sequence[Any], payloads: Sequence[Dict[str, Any]]) -> "BM25Index":
+        index = cls([], [], [], {})
+        index.add(ids, payloads)
+        return index
+
+    def add(self, ids: Sequence[Any], payloads: Sequence[Dict[str, Any]]):
+        for pid, payload in zip(ids, payloads):
+            row = len(self.ids)
+            # Manual chunks carry "chunk", video transcripts carry "text".
+            tokens = tokenize(payload.get("chunk") or payload.get("text") or "")
+            self.ids.append(pid)
+            self.payloads.append(payload)
+            self.doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((row, tf))
+        self.avgdl = (sum(self.doc_lens) / len(self.doc_lens)) if self.doc_lens else 0.0
+
+    def remove_ids(self, ids: Sequence[Any]) -> int:
+        """Drops these documents (compacting rows and postings); returns how many were found."""
+        drop = {str(pid) for pid in ids}
+        keep = [row for row, pid in enumerate(self.ids) if str(pid) not in drop]
+        removed = len(self.ids) - len(keep)
+        if not removed:
+            return 0
+        new_row = {old: new for new, old in enumerate(keep)}
+        postings = {}
+        for term, plist in self.postings.items():
+            kept = [(new_row[row], tf) for row, tf in plist if row in new_row]
+            if kept:
+                postings[term] = kept
+        self.postings = postings
+        self.ids = [self.ids[row] for row in keep]
+        self.payloads = [self.payloads[row] for row in keep]
+        self.doc_lens = [self.doc_lens[row] for row in keep]
+        self.avgdl = (sum(self.doc_lens) / len(self.doc_lens)) if self.doc_lens else 0.0
+        return removed
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """Returns (row, bm25 score) pairs, best first."""
+        n = len(self.doc_lens)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1.0 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for row, tf in plist:
+                norm = self.k1 * (1.0 - self.b + self.b * self.doc_lens[row] / (self.avgdl or 1.0))
+                scores[row] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]
+
+    def save(self, path: str):
+        ensure_dir(os.path.dirname(path))
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": self.ids, "payloads": self.payloads, "doc_lens": self.doc_lens,
+                "postings": self.postings, "k1": self.k1, "b": self.b,
+            }, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+        print(f"[BM25] Wrote {len(self.ids)} documents / {len(self.postings)} terms to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        postings = {term: [tuple(p) for p in plist] for term, plist in d["postings"].items()}
+        return cls(d["ids"], d["payloads"], d["doc_lens"], postings, k1=d.get("k1", 1.5), b=d.get("b", 0.75))
@@ -1,18 +1,104 @@
 # Optional OCR helpers using EasyOCR (install separately)
-from typing import List, Dict, Any, Optional
-import io
+# Readers are expensive to build (detection + recognition networks), so they are created once
+# per language set and reused; results can be cached on disk by image hash.
+import io, queue, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 try:
     import easyocr
 except Exception:
     easyocr = None
 
-def ocr_image_bytes(image_bytes: bytes, languages: List[str]=["en"]) -> str:
-    if easyocr is None:
-        return ""
-    reader = easyocr.Reader(languages, gpu=False)
+from utils import ContentCache, content_key
+
+
+class ReaderPool:
+    """Up to `size` easyocr.Readers for one language set, each used by one thread at a time."""
+
+    def __init__(self, languages: List[str], size: int = 1, gpu: bool = False):
+        self.languages = list(languages)
+        self.size = max(1, size)
+        self.gpu = gpu
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            print(f"[OCR] Loading EasyOCR reader {self._created}/{self.size} for {self.languages}")
+            return easyocr.Reader(self.languages, gpu=self.gpu)
+        return self._idle.get()
+
+    def release(self, reader):
+        self._idle.put(reader)
+
+    def grow(self, size: int):
+        with self._lock:
+            self.size = max(self.size, size)
+
+
+_pools: Dict[Tuple[str, ...], ReaderPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_reader_pool(languages: List[str], size: int = 1) -> ReaderPool:
+    key = tuple(languages)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ReaderPool(languages, size)
+        _pools[key].grow(size)
+        return _pools[key]
+
+
+def _read(pool: ReaderPool, image_bytes: bytes) -> str:
     import numpy as np
     import PIL.Image as Image
     img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
     arr = np.array(img)
-    results = reader.readtext(arr, detail=0)
+    reader = pool.acquire()
+    try:
+        results = reader.readtext(arr, detail=0)
+    finally:
+        pool.release(reader)
     return "\n".join(results)
+
+
+def ocr_images(image_bytes_list: List[bytes], languages: List[str] = ["en"], workers: int = 1,
+               cache: Optional[ContentCache] = None) -> List[str]:
+    """
+    OCR text per image, in order. Cached and repeated images are read once; the rest are
+    spread over `workers` threads, each with its own pooled reader.
+    """
+    if easyocr is None:
+        return [""] * len(image_bytes_list)
+    keys = [content_key(b, "easyocr", ",".join(languages)) for b in image_bytes_list]
+    known = cache.get_many(keys) if cache is not None else {}
+    todo = {}
+    for k, b in zip(keys, image_bytes_list):
+        if k not in known and k not in todo:
+            todo[k] = b
+
+    if todo:
+        pool = get_reader_pool(languages, workers)
+        if workers > 1 and len(todo) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(todo)), thread_name_prefix="ocr") as ex:
+                texts = list(ex.map(lambda b: _read(pool, b), todo.values()))
+        else:
+            texts = [_read(pool, b) for b in todo.values()]
+        fresh = dict(zip(todo, texts))
+        if cache is not None:
+            cache.put_many(fresh)
+        known = {**known, **fresh}
+    return [known[k] for k in keys]
+
+
+def ocr_image_bytes(image_bytes: bytes, languages: List[str]=["en"]) -> str:
+    return ocr_images([image_bytes], languages)[0]
@@ -0,0 +1,67 @@
+# Speculative candidate sets, computed when the gateway reports a new crosshair target and
+# reused by /query once the spoken question arrives.
+import time, threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from embedding_cache import normalize_query_text
+from retriever import SearchHit
+
+
+class PrefetchedSet(NamedTuple):
+    target_object: str
+    hits: List[SearchHit]
+    vectors: np.ndarray  # L2-normalised chunk embeddings, one row per hit
+    created: float
+
+
+class PrefetchCache:
+    def __init__(self, ttl_seconds: float = 120, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, PrefetchedSet]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(target_object: str) -> str:
+        return normalize_query_text(target_object).lower()
+
+    def get(self, target_object: str) -> Optional[PrefetchedSet]:
+        key = self.key(target_object)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry.created > self.ttl_seconds:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, target_object: str, hits: List[SearchHit], vectors: np.ndarray) -> PrefetchedSet:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        entry = PrefetchedSet(target_object, hits, vectors, time.monotonic())
+        with self._lock:
+            self._entries[self.key(target_object)] = entry
+            self._entries.move_to_end(self.key(target_object))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def rank_by_similarity(entry: PrefetchedSet, query_vector: np.ndarray) -> List[SearchHit]:
+    """Orders a prefetched set by cosine similarity to the full query, without touching the index."""
+    q = np.asarray(query_vector, dtype=np.float32)
+    q = q / (np.linalg.norm(q) or 1.0)
+    sims = entry.vectors @ q
+    order = np.argsort(-sims)
+    return [entry.hits[i]._replace(score=float(sims[i]), similarity=float(sims[i])) for i in order]
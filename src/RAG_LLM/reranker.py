@@ -0,0 +1,61 @@
+# Cross-encoder reranking of retrieved chunks, so only the best few reach the LLM prompt.
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sentence_transformers import CrossEncoder
+
+from retriever import SearchHit
+
+
+def hit_text(hit: SearchHit) -> str:
+    # Manual chunks carry "chunk", video transcripts carry "text".
+    return hit.payload.get("chunk") or hit.payload.get("text") or ""
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str, cache_size: int = 4096, device: str = None):
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, device=device)
+        self.cache_size = cache_size
+        self._scores: "OrderedDict[Tuple[str, Any], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        print(f"[Rerank] Loaded cross-encoder '{model_name}'")
+
+    def score(self, query: str, hits: Sequence[SearchHit]) -> List[float]:
+        """Scores every (query, chunk) pair, running the uncached ones in one batched forward pass."""
+        keys = [(query, hit.id) for hit in hits]
+        scores = [None] * len(hits)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[i] = self._scores[key]
+        todo = [i for i, sc in enumerate(scores) if sc is None]
+        if todo:
+            pairs = [(query, hit_text(hits[i])) for i in todo]
+            predicted = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+            with self._lock:
+                for i, sc in zip(todo, predicted):
+                    scores[i] = float(sc)
+                    self._scores[keys[i]] = scores[i]
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, hits: Sequence[SearchHit], top_n: int) -> List[SearchHit]:
+        if not hits:
+            return []
+        scores = self.score(query, hits)
+        ranked = sorted(zip(hits, scores), key=lambda x: x[1], reverse=True)[:top_n]
+        return [hit._replace(score=sc) for hit, sc in ranked]
+
+
+def build_reranker(cfg: Dict[str, Any]) -> Optional[CrossEncoderReranker]:
+    retrieval_cfg = cfg.get("retrieval", {})
+    if not retrieval_cfg.get("use_reranker", False):
+        return None
+    return CrossEncoderReranker(
+        retrieval_cfg.get("reranker_model", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+        cache_size=int(retrieval_cfg.get("rerank_cache_size", 4096)),
+    )
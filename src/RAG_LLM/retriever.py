@@ -0,0 +1,531 @@
+# Pluggable vector retrieval: remote Qdrant or an in-process FAISS IVF-PQ index.
+import os, json, time, asyncio, argparse, threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import faiss
+except Exception:
+    faiss = None
+
+from utils import ensure_dir, load_config, resolve_config_path
+from lexical_index import BM25Index, lexical_index_path
+from concurrency import run_blocking
+
+# IVF training wants roughly 39 vectors per centroid; PQ with 8-bit codes needs 256.
+MIN_POINTS_PER_CENTROID = 39
+PQ_TRAINING_POINTS = 256
+
+
+class SearchHit(NamedTuple):
+    """Backend-neutral search result, shaped like Qdrant's ScoredPoint."""
+    id: Any
+    score: float
+    payload: Dict[str, Any]
+    similarity: Optional[float] = None  # dense cosine similarity, None for lexical-only hits
+
+
+def payload_matches(payload: Dict[str, Any], should: Optional[Dict[str, Sequence[Any]]]) -> bool:
+    """Mirrors a Qdrant `Filter(should=[MatchAny...])`: any field matching any value passes."""
+    if not should:
+        return True
+    for key, values in should.items():
+        field = payload.get(key)
+        field_values = field if isinstance(field, list) else [field]
+        if any(v in values for v in field_values):
+            return True
+    return False
+
+
+def index_paths(index_dir: str, collection_name: str) -> Dict[str, str]:
+    return {
+        "index": os.path.join(index_dir, f"{collection_name}.faiss"),
+        "payloads": os.path.join(index_dir, f"{collection_name}.payloads.jsonl"),
+    }
+
+
+class QdrantRetriever:
+    def __init__(self, client, collection_name: str, version_check_seconds: float = 30, async_client=None):
+        self.client = client
+        self.async_client = async_client
+        self.collection_name = collection_name
+        self.version_check_seconds = version_check_seconds
+        self._version = None
+        self._version_checked = 0.0
+        self._version_lock = threading.Lock()
+
+    def version(self):
+        """Cheap fingerprint of the collection contents, refreshed at most every version_check_seconds."""
+        with self._version_lock:
+            now = time.monotonic()
+            if self._version is None or now - self._version_checked >= self.version_check_seconds:
+                info = self.client.get_collection(self.collection_name)
+                self._version = (info.points_count, info.segments_count)
+                self._version_checked = now
+            return self._version
+
+    def refresh(self, force: bool = False):
+        # Qdrant serves writes live; a forced refresh only drops the cached fingerprint.
+        if force:
+            with self._version_lock:
+                self._version = None
+
+    def _search_args(self, query_vector: np.ndarray, limit: int, should: Optional[Dict[str, Sequence[Any]]]) -> Dict[str, Any]:
+        from qdrant_client import models
+        query_filter = None
+        if should:
+            query_filter = models.Filter(should=[
+                models.FieldCondition(key=k, match=models.MatchAny(any=list(v))) for k, v in should.items()
+            ])
+        return dict(
+            collection_name=self.collection_name,
+            query_vector=np.asarray(query_vector, dtype=np.float32).tolist(),
+            query_filter=query_filter,
+            limit=limit,
+            with_payload=True,
+        )
+
+    def search(self, query_vector: np.ndarray, limit: int, should: Optional[Dict[str, Sequence[Any]]] = None,
+               query_text: Optional[str] = None) -> List[SearchHit]:
+        results = self.client.search(**self._search_args(query_vector, limit, should))
+        return [SearchHit(r.id, r.score, r.payload or {}, r.score) for r in results]
+
+    def vectors(self, ids: Sequence[Any]) -> Optional[np.ndarray]:
+        """Stored vectors for these point ids (one row each), or None if any is missing."""
+        records = self.client.retrieve(collection_name=self.collection_name, ids=list(ids),
+                                       with_payload=False, with_vectors=True)
+        by_id = {str(r.id): r.vector for r in records}
+        if any(str(i) not in by_id for i in ids):
+            return None
+        return np.asarray([by_id[str(i)] for i in ids], dtype=np.float32)
+
+    async def asearch(self, query_vector: np.ndarray, limit: int, should: Optional[Dict[str, Sequence[Any]]] = None,
+                      query_text: Optional[str] = None, executor=None) -> List[SearchHit]:
+        if self.async_client is None:
+            return await run_blocking(executor, self.search, query_vector, limit, should=should)
+        results = await self.async_client.search(**self._search_args(query_vector, limit, should))
+        return [SearchHit(r.id, r.score, r.payload or {}, r.score) for r in results]
+
+
+class FaissRetriever:
+    def __init__(self, index_dir: str, collection_name: str, nprobe: int = 16, reload_check_seconds: float = 5):
+        if faiss is None:
+            raise RuntimeError("faiss is not installed; install faiss-cpu or use retrieval.backend=qdrant")
+        self.paths = index_paths(index_dir, collection_name)
+        self.collection_name = collection_name
+        self.nprobe = nprobe
+        self.reload_check_seconds = reload_check_seconds
+        self._reload_lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._version, self._state = self._load()
+        print(f"[FAISS] Loaded '{collection_name}' ({self._state[0].ntotal} vectors) from {self.paths['index']}")
+
+    def _mtimes(self):
+        return os.path.getmtime(self.paths["index"]), os.path.getmtime(self.paths["payloads"])
+
+    def _load(self):
+        version = self._mtimes()
+        try:
+            # Memory-map the inverted lists so startup cost and RSS don't scale with the corpus.
+            index = faiss.read_index(self.paths["index"], faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            index = faiss.read_index(self.paths["index"])
+        try:
+            ivf = faiss.extract_index_ivf(index)
+            ivf.nprobe = self.nprobe
+            # Labels have gaps after incremental removals, so map them with a hashtable
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)  # lets vectors() reconstruct stored rows
+        except RuntimeError:
+            pass  # flat index: nothing to probe, reconstructs directly
+        # Row = FAISS label; rows removed by incremental updates are None
+        ids, payloads = load_faiss_sidecar(self.paths["payloads"])
+        rows = {str(pid): row for row, pid in enumerate(ids) if pid is not None}
+        if self._mtimes() != version or len(rows) != index.ntotal:
+            # Caught between the index and sidecar replaces of an update; retry on the next check
+            raise RuntimeError(f"index files for '{self.collection_name}' changed while loading")
+        return version, (index, ids, payloads, rows)
+
+    def refresh(self, force: bool = False):
+        """Swaps in the index files if an ingest replaced them, checking at most every reload_check_seconds."""
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_check_seconds:
+            return
+        with self._reload_lock:
+            if not force and now - self._checked < self.reload_check_seconds:
+                return
+            self._checked = now
+            try:
+                if self._mtimes() == self._version:
+                    return
+                self._version, self._state = self._load()
+            except (OSError, RuntimeError, ValueError) as e:
+                print(f"[FAISS] Keeping the loaded '{self.collection_name}' index: {e}")
+                return
+            print(f"[FAISS] Reloaded '{self.collection_name}' ({self._state[0].ntotal} vectors)")
+
+    def version(self):
+        self.refresh()
+        return self._version
+
+    def vectors(self, ids: Sequence[Any]) -> Optional[np.ndarray]:
+        """Stored (for IVF-PQ: decoded) vectors for these point ids, or None if any can't be read back."""
+        self.refresh()
+        index, _, _, row_of = self._state
+        rows = [row_of.get(str(i)) for i in ids]
+        if any(r is None for r in rows):
+            return None
+        try:
+            return np.vstack([index.reconstruct(int(r)) for r in rows]).astype(np.float32, copy=False)
+        except RuntimeError:
+            return None
+
+    def search(self, query_vector: np.ndarray, limit: int, should: Optional[Dict[str, Sequence[Any]]] = None,
+               query_text: Optional[str] = None) -> List[SearchHit]:
+        self.refresh()
+        index, ids, payloads, _ = self._state  # one snapshot, in case a reload swaps it mid-search
+        if index.ntotal == 0:
+            return []
+        q = np.array(query_vector, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(q)  # cosine, like the Qdrant collections
+        # Payload filters are applied after the ANN lookup, so over-fetch when filtering.
+        k = min(index.ntotal, limit * 8 if should else limit)
+        scores, rows = index.search(q, k)
+        hits = []
+        for score, row in zip(scores[0], rows[0]):
+            if row < 0:
+                continue
+            payload = payloads[row]
+            if payload is None or not payload_matches(payload, should):
+                continue
+            hits.append(SearchHit(ids[row], float(score), payload, float(score)))
+            if len(hits) >= limit:
+                break
+        return hits
+
+    async def asearch(self, query_vector: np.ndarray, limit: int, should: Optional[Dict[str, Sequence[Any]]] = None,
+                      query_text: Optional[str] = None, executor=None) -> List[SearchHit]:
+        # In-process ANN search is CPU work; keep it off the event loop.
+        return await run_blocking(executor, self.search, query_vector, limit, should=should)
+
+
+def fuse_rankings(rankings: List[List[Tuple[Any, float]]], weights: Sequence[float],
+                  method: str = "rrf", rrf_k: int = 60) -> List[Tuple[Any, float]]:
+    """Merges several (key, score) rankings into one, best first.
+
+    "rrf" sums weight / (rrf_k + rank); "weighted" sums weight * min-max normalised score.
+    """
+    fused = {}
+    for ranking, w in zip(rankings, weights):
+        if not ranking:
+            continue
+        if method == "rrf":
+            for rank, (key, _) in enumerate(ranking, start=1):
+                fused[key] = fused.get(key, 0.0) + w / (rrf_k + rank)
+        elif method == "weighted":
+            lo = min(sc for _, sc in ranking)
+            hi = max(sc for _, sc in ranking)
+            for key, sc in ranking:
+                norm = (sc - lo) / (hi - lo) if hi > lo else 1.0
+                fused[key] = fused.get(key, 0.0) + w * norm
+        else:
+            raise ValueError(f"Unknown fusion method: {method}")
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+class HybridRetriever:
+    """Runs a dense retriever and the BM25 index side by side and fuses their rankings.
+
+    The BM25 file is reloaded when an ingest replaces it; until it exists, search is dense-only.
+    """
+
+    def __init__(self, dense, lexical_path: str, retrieval_cfg: Dict[str, Any], reload_check_seconds: float = 5):
+        self.dense = dense
+        self.lexical_path = lexical_path
+        self.lexical: Optional[BM25Index] = None
+        self._lexical_version = None
+        self.reload_check_seconds = reload_check_seconds
+        self._checked = None
+        self._reload_lock = threading.Lock()
+        self.collection_name = dense.collection_name
+        self.method = retrieval_cfg.get("fusion", "rrf")
+        self.rrf_k = int(retrieval_cfg.get("rrf_k", 60))
+        # Equal RRF weights by default: with k=60, any lexical/dense ratio much below 1 puts a
+        # BM25-only rank-1 hit (an exact part number) behind the dense tail, so it never
+        # reaches the reranker.
+        self.weights = (float(retrieval_cfg.get("fuse_weight_dense", 0.5)),
+                        float(retrieval_cfg.get("fuse_weight_lexical", 0.5)))
+        self.candidate_k = int(retrieval_cfg.get("top_k_text", 40))
+        w_dense, w_lex = self.weights
+        if self.method == "rrf" and w_lex / (self.rrf_k + 1) <= w_dense / (self.rrf_k + self.candidate_k):
+            print(f"[Hybrid] Warning: fuse_weight_lexical={w_lex} is too low for rrf_k={self.rrf_k}; "
+                  f"a BM25-only top hit ranks below dense hit #{self.candidate_k} and is cut")
+
+        self.refresh(force=True)
+
+    def _reload_due(self) -> bool:
+        return self._checked is None or time.monotonic() - self._checked >= self.reload_check_seconds
+
+    def refresh(self, force: bool = False):
+        """Reloads the BM25 index if its file changed, checking at most every reload_check_seconds."""
+        self.dense.refresh(force=force)
+        if not force and not self._reload_due():
+            return
+        with self._reload_lock:
+            if not force and not self._reload_due():
+                return
+            self._checked = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.lexical_path)
+            except OSError:
+                if self._lexical_version is None:
+                    print(f"[Hybrid] No lexical index at {self.lexical_path}; serving "
+                          f"'{self.collection_name}' with dense search only")
+                    self._lexical_version = False
+                return
+            if mtime == self._lexical_version:
+                return
+            try:
+                lexical = BM25Index.load(self.lexical_path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[Hybrid] Keeping the loaded BM25 index for '{self.collection_name}': {e}")
+                return
+            self.lexical, self._lexical_version = lexical, mtime
+            print(f"[Hybrid] Loaded BM25 index for '{self.collection_name}' ({len(lexical.ids)} documents)")
+
+    def version(self):
+        self.refresh()
+        return (self.dense.version(), self._lexical_version)
+
+    def vectors(self, ids: Sequence[Any]) -> Optional[np.ndarray]:
+        return self.dense.vectors(ids)
+
+    def search(self, query_vector: np.ndarray, limit: int, should: Optional[Dict[str, Sequence[Any]]] = None,
+               query_text: Optional[str] = None) -> List[SearchHit]:
+        self.refresh()
+        depth = max(limit, self.candidate_k)
+        dense_hits = self.dense.search(query_vector, depth, should=should)
+        lexical = self.lexical
+        if not query_text or lexical is None:
+            return dense_hits[:limit]
+        return self._fuse(dense_hits, lexical, lexical.search(query_text, depth), limit, should)
+
+    async def asearch(self, query_vector: np.ndarray, limit: int, should: Optional[Dict[str, Sequence[Any]]] = None,
+                      query_text: Optional[str] = None, executor=None) -> List[SearchHit]:
+        if self._reload_due():
+            await run_blocking(executor, self.refresh)
+        depth = max(limit, self.candidate_k)
+        lexical = self.lexical
+        if not query_text or lexical is None:
+            return (await self.dense.asearch(query_vector, depth, should=should, executor=executor))[:limit]
+        dense_hits, lexical_hits = await asyncio.gather(
+            self.dense.asearch(query_vector, depth, should=should, executor=executor),
+            run_blocking(executor, lexical.search, query_text, depth),
+        )
+        return self._fuse(dense_hits, lexical, lexical_hits, limit, should)
+
+    def _fuse(self, dense_hits: List[SearchHit], lexical: BM25Index, lexical_hits: List[Tuple[int, float]],
+              limit: int, should: Optional[Dict[str, Sequence[Any]]]) -> List[SearchHit]:
+        hits_by_id = {h.id: h for h in dense_hits}
+        lexical_ranking = []
+        for row, score in lexical_hits:
+            pid, payload = lexical.ids[row], lexical.payloads[row]
+            if not payload_matches(payload, should):
+                continue
+            hits_by_id.setdefault(pid, SearchHit(pid, score, payload, None))
+            lexical_ranking.append((pid, score))
+
+        fused = fuse_rankings([[(h.id, h.score) for h in dense_hits], lexical_ranking],
+                              self.weights, method=self.method, rrf_k=self.rrf_k)
+        return [hits_by_id[pid]._replace(score=score) for pid, score in fused[:limit]]
+
+
+def load_faiss_sidecar(path: str) -> Tuple[List[Any], List[Optional[Dict[str, Any]]]]:
+    ids, payloads = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            ids.append(rec["id"])
+            payloads.append(rec["payload"])
+    return ids, payloads
+
+
+def _write_faiss_index(index, ids: Sequence[Any], payloads: Sequence[Optional[Dict[str, Any]]],
+                       index_dir: str, collection_name: str) -> Dict[str, str]:
+    ensure_dir(index_dir)
+    paths = index_paths(index_dir, collection_name)
+    # Write to temp files and swap in, so a running server never maps a half-written index.
+    faiss.write_index(index, paths["index"] + ".tmp")
+    with open(paths["payloads"] + ".tmp", "w", encoding="utf-8") as f:
+        for pid, payload in zip(ids, payloads):
+            f.write(json.dumps({"id": pid, "payload": payload}, ensure_ascii=False) + "\n")
+    os.replace(paths["index"] + ".tmp", paths["index"])
+    os.replace(paths["payloads"] + ".tmp", paths["payloads"])
+    return paths
+
+
+def build_faiss_index(vectors: np.ndarray, ids: Sequence[Any], payloads: Sequence[Dict[str, Any]],
+                      index_dir: str, collection_name: str, faiss_cfg: Dict[str, Any]) -> str:
+    """Train (if IVF-PQ) and persist an inner-product index plus its id/payload sidecar."""
+    if faiss is None:
+        raise RuntimeError("faiss is not installed; cannot build a local index")
+    vectors = np.array(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    n, dim = vectors.shape
+    nlist = min(int(faiss_cfg.get("nlist", 2048)), n // MIN_POINTS_PER_CENTROID)
+    m_pq = int(faiss_cfg.get("m_pq", 64))
+
+    if faiss_cfg.get("use_ivf_pq", True) and nlist >= 1 and n >= PQ_TRAINING_POINTS and dim % m_pq == 0:
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, m_pq, 8, faiss.METRIC_INNER_PRODUCT)
+        print(f"[FAISS] Training IVF-PQ (nlist={nlist}, m={m_pq}) on {n} vectors...")
+        index.train(vectors)
+    else:
+        print(f"[FAISS] {n} vectors are too few for IVF-PQ (or dim {dim} % m_pq != 0); using a flat index")
+        # IDMap keeps labels stable when update_faiss_index removes rows (bare flat indexes renumber)
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    index.add_with_ids(vectors, np.arange(n, dtype=np.int64))
+
+    paths = _write_faiss_index(index, ids, payloads, index_dir, collection_name)
+    print(f"[FAISS] Wrote {n} vectors to {paths['index']}")
+    return paths["index"]
+
+
+def update_faiss_index(index_dir: str, collection_name: str, remove_ids: Sequence[Any], add_ids: Sequence[Any],
+                       add_vectors: np.ndarray, add_payloads: Sequence[Dict[str, Any]],
+                       max_removed_ratio: float = 0.5) -> bool:
+    """
+    Removes and appends points in the persisted index without retraining; new vectors go to the
+    existing IVF lists. Returns False when a full build_faiss_index is needed instead: no index
+    yet, one without stable labels (a bare flat index from before), or more than
+    max_removed_ratio of its rows already removed.
+    """
+    if faiss is None:
+        raise RuntimeError("faiss is not installed; cannot update a local index")
+    paths = index_paths(index_dir, collection_name)
+    if not (os.path.exists(paths["index"]) and os.path.exists(paths["payloads"])):
+        return False
+    index = faiss.read_index(paths["index"])
+    if not isinstance(faiss.downcast_index(index), (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexIVF)):
+        return False
+    ids, payloads = load_faiss_sidecar(paths["payloads"])
+
+    drop = {str(pid) for pid in remove_ids}
+    rows = [row for row, pid in enumerate(ids) if pid is not None and str(pid) in drop]
+    if not rows and not len(add_ids):
+        return True  # nothing changed; keep the files (and their mtimes) as they are
+    if rows:
+        index.remove_ids(faiss.IDSelectorBatch(np.asarray(rows, dtype=np.int64)))
+        for row in rows:
+            ids[row] = payloads[row] = None
+    removed_total = sum(1 for pid in ids if pid is None)
+    if len(ids) and removed_total / (len(ids) + len(add_ids)) > max_removed_ratio:
+        return False
+
+    if len(add_ids):
+        vectors = np.array(add_vectors, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        index.add_with_ids(vectors, np.arange(len(ids), len(ids) + len(add_ids), dtype=np.int64))
+        ids.extend(add_ids)
+        payloads.extend(add_payloads)
+    _write_faiss_index(index, ids, payloads, index_dir, collection_name)
+    print(f"[FAISS] Updated {paths['index']}: -{len(rows)} +{len(add_ids)} vectors ({index.ntotal} total)")
+    return True
+
+
+def export_collection(client, collection_name: str, batch_size: int = 1000, with_vectors: bool = True):
+    """Scrolls every point out of a Qdrant collection; vectors come back empty unless with_vectors."""
+    ids, vectors, payloads = [], [], []
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection_name, limit=batch_size, offset=offset,
+            with_payload=True, with_vectors=with_vectors,
+        )
+        for r in records:
+            ids.append(r.id)
+            if with_vectors:
+                vectors.append(r.vector)
+            payloads.append(r.payload or {})
+        if offset is None:
+            break
+    return ids, np.asarray(vectors, dtype=np.float32), payloads
+
+
+def update_local_indexes(client, collection_name: str, index_dir: str, cfg: Dict[str, Any],
+                         remove_ids: Sequence[Any] = (), add_ids: Sequence[Any] = (),
+                         add_vectors: Optional[np.ndarray] = None, add_payloads: Sequence[Dict[str, Any]] = (),
+                         full: bool = False):
+    """
+    Brings the local FAISS (retrieval.backend=faiss) and BM25 (retrieval.hybrid) indexes in line
+    with an ingest run. Existing index files get just the removed/added points; a missing (or
+    unupdatable) index, or full=True, is rebuilt from the whole collection instead.
+    """
+    retrieval_cfg = cfg.get("retrieval", {})
+    bm25_path = lexical_index_path(index_dir, collection_name)
+    rebuild_faiss = retrieval_cfg.get("backend") == "faiss" and (full or not update_faiss_index(
+        index_dir, collection_name, remove_ids, add_ids, add_vectors, add_payloads))
+    rebuild_bm25 = False
+    if retrieval_cfg.get("hybrid", False):
+        if full or not os.path.exists(bm25_path):
+            rebuild_bm25 = True
+        elif len(remove_ids) or len(add_ids):
+            bm25 = BM25Index.load(bm25_path)
+            removed = bm25.remove_ids(remove_ids)
+            bm25.add(add_ids, add_payloads)
+            bm25.save(bm25_path)
+            print(f"[BM25] Updated {bm25_path}: -{removed} +{len(add_ids)} documents")
+    if (rebuild_faiss or rebuild_bm25) and client.collection_exists(collection_name):
+        # Vectors are only needed for FAISS; the BM25 rebuild reads payloads alone
+        ids, vectors, payloads = export_collection(client, collection_name, with_vectors=rebuild_faiss)
+        if rebuild_faiss and len(ids):
+            build_faiss_index(vectors, ids, payloads, index_dir, collection_name, cfg.get("faiss", {}))
+        if rebuild_bm25:
+            BM25Index.build(ids, payloads).save(bm25_path)
+
+
+def build_dense_retriever(cfg: Dict[str, Any], config_path: str, collection_name: str, qdrant_client=None, async_qdrant_client=None):
+    backend = cfg.get("retrieval", {}).get("backend", "qdrant")
+    if backend == "faiss":
+        index_dir = resolve_config_path(config_path, cfg.get("index", {}).get("local_dir", "indexes"))
+        return FaissRetriever(index_dir, collection_name, nprobe=int(cfg.get("faiss", {}).get("nprobe", 16)),
+                              reload_check_seconds=float(cfg.get("cache", {}).get("index_reload_check_seconds", 5)))
+    if backend == "qdrant":
+        if qdrant_client is None:
+            raise ValueError("retrieval.backend=qdrant needs a QdrantClient")
+        return QdrantRetriever(qdrant_client, collection_name,
+                               version_check_seconds=float(cfg.get("cache", {}).get("collection_version_check_seconds", 30)),
+                               async_client=async_qdrant_client)
+    raise ValueError(f"Unknown retrieval backend: {backend}")
+
+
+def build_retriever(cfg: Dict[str, Any], config_path: str, collection_name: str, qdrant_client=None, async_qdrant_client=None):
+    dense = build_dense_retriever(cfg, config_path, collection_name, qdrant_client=qdrant_client,
+                                  async_qdrant_client=async_qdrant_client)
+    retrieval_cfg = cfg.get("retrieval", {})
+    if not retrieval_cfg.get("hybrid", False):
+        return dense
+    index_dir = resolve_config_path(config_path, cfg.get("index", {}).get("local_dir", "indexes"))
+    print(f"[Hybrid] Fusing dense + BM25 ({retrieval_cfg.get('fusion', 'rrf')}) for '{collection_name}'")
+    return HybridRetriever(dense, lexical_index_path(index_dir, collection_name), retrieval_cfg,
+                           reload_check_seconds=float(cfg.get("cache", {}).get("index_reload_check_seconds", 5)))
+
+
+if __name__ == "__main__":
+    # Rebuild the local FAISS index of an existing Qdrant collection without re-ingesting.
+    from dotenv import load_dotenv
+    from qdrant_client import QdrantClient
+
+    load_dotenv()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--collection", default=os.getenv("QDRANT_COLLECTION", "xr_rag_server"))
+    ap.add_argument("--config", default="config.yaml")
+    args = ap.parse_args()
+
+    cfg = load_config(args.config)
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    ids, vectors, payloads = export_collection(client, args.collection)
+    index_dir = resolve_config_path(args.config, cfg.get("index", {}).get("local_dir", "indexes"))
+    build_faiss_index(vectors, ids, payloads, index_dir, args.collection, cfg.get("faiss", {}))
+    if cfg.get("retrieval", {}).get("hybrid", False):
+        BM25Index.build(ids, payloads).save(lexical_index_path(index_dir, args.collection))
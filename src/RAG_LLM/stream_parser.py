@@ -0,0 +1,71 @@
+# Incremental parser for the {"goal": ..., "steps": [...], "warnings": [...]} answer, fed
+# token by token while the LLM is still streaming.
+import json
+from typing import List, Tuple
+
+
+class StepStreamParser:
+    """
+    Tracks just enough JSON structure to know when a top-level string value, or a string
+    element of a top-level array, has been completely written. Text before the opening
+    brace (e.g. a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self.stack = []          # open containers: "{" or "["
+        self.in_string = False
+        self.escape = False
+        self.buf = []            # raw characters of the string being read
+        self.expect_key = False  # inside the top-level object, before a key's ':'
+        self.key = None          # current top-level key
+        self.done = False
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """Returns (top-level key, completed string) pairs found in this piece of text."""
+        out = []
+        for ch in text:
+            if self.done:
+                break
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                    self.buf.append(ch)
+                elif ch == "\\":
+                    self.escape = True
+                    self.buf.append(ch)
+                elif ch == '"':
+                    self.in_string = False
+                    self._string_done(json.loads('"' + "".join(self.buf) + '"'), out)
+                else:
+                    self.buf.append(ch)
+                continue
+
+            if not self.stack:
+                if ch == "{":
+                    self.stack.append("{")
+                    self.expect_key = True
+                continue
+            if ch == '"':
+                self.in_string = True
+                self.buf = []
+            elif ch in "{[":
+                self.stack.append(ch)
+            elif ch in "}]":
+                self.stack.pop()
+                if not self.stack:
+                    self.done = True
+            elif ch == ":" and len(self.stack) == 1:
+                self.expect_key = False
+            elif ch == "," and len(self.stack) == 1:
+                self.expect_key = True
+        return out
+
+    def _string_done(self, value: str, out: List[Tuple[str, str]]):
+        depth = len(self.stack)
+        if depth == 1:
+            if self.expect_key:
+                self.key = value
+            else:
+                out.append((self.key, value))
+        elif depth == 2 and self.stack[1] == "[":
+            out.append((self.key, value))
@@ -1,11 +1,22 @@
-import os, re, io, json, hashlib, pathlib
-from typing import List, Dict, Any, Optional, Tuple
+import os, re, io, json, hashlib, pathlib, sqlite3, threading
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from bs4 import BeautifulSoup
 import fitz  # PyMuPDF
+import yaml
 
 def ensure_dir(p: str):
     os.makedirs(p, exist_ok=True)
 
+def load_config(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+def resolve_config_path(config_path: str, p: str) -> str:
+    # Relative paths in config.yaml are relative to the config file, not the CWD.
+    if os.path.isabs(p):
+        return p
+    return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(config_path)), p))
+
 def file_md5(path: str) -> str:
     h = hashlib.md5()
     with open(path, "rb") as f:
@@ -13,21 +24,125 @@ def file_md5(path: str) -> str:
             h.update(chunk)
     return h.hexdigest()
 
-def load_text_from_pdf(path: str) -> Tuple[str, List[Dict[str, Any]]]:
+def content_key(*parts) -> str:
+    """sha256 over the given parts (bytes or anything str()-able), for content-addressed caches."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+class ContentCache:
+    """
+    On-disk key -> JSON value store (sqlite) for results derived from content hashes, such as
+    image captions or OCR text. One file can hold several namespaces; safe to share across threads.
+    """
+
+    def __init__(self, path: str, namespace: str):
+        ensure_dir(os.path.dirname(os.path.abspath(path)))
+        self.path = path
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (ns TEXT, key TEXT, value TEXT, PRIMARY KEY (ns, key))")
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique), 500):
+                part = unique[i:i+500]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE ns = ? AND key IN ({','.join('?' * len(part))})",
+                    [self.namespace, *part],
+                ).fetchall()
+                found.update((k, json.loads(v)) for k, v in rows)
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, Any]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (ns, key, value) VALUES (?, ?, ?)",
+                [(self.namespace, k, json.dumps(v)) for k, v in items.items()],
+            )
+
+    def put(self, key: str, value: Any):
+        self.put_many({key: value})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": (self.hits / total) if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def iter_pdf_pages(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields {"page", "text", "images", "image_xrefs"} one page at a time. An image shared by
+    many pages (logos, pictograms) is extracted once, on the first page that references it;
+    "image_xrefs" still lists every image on the page.
+    """
     doc = fitz.open(path)
+    seen = set()
+    try:
+        for pno in range(len(doc)):
+            page = doc[pno]
+            xrefs, images = [], []
+            for img in page.get_images(full=True):
+                xref = img[0]
+                if xref in xrefs:
+                    continue
+                xrefs.append(xref)
+                if xref in seen:
+                    continue
+                seen.add(xref)
+                base_img = doc.extract_image(xref)
+                images.append({"page": pno, "xref": xref, "ext": base_img.get("ext", "png"), "image_bytes": base_img["image"]})
+            yield {"page": pno, "text": page.get_text("text"), "images": images, "image_xrefs": xrefs}
+    finally:
+        doc.close()
+
+def load_text_from_pdf(path: str) -> Tuple[str, List[Dict[str, Any]]]:
     texts = []
     images = []
-    for pno in range(len(doc)):
-        page = doc[pno]
-        texts.append(page.get_text("text"))
-        for img in page.get_images(full=True):
-            xref = img[0]
-            base_img = doc.extract_image(xref)
-            ext = base_img.get("ext", "png")
-            image_bytes = base_img["image"]
-            images.append({"page": pno, "xref": xref, "ext": ext, "image_bytes": image_bytes})
+    for page in iter_pdf_pages(path):
+        texts.append(page["text"])
+        images.extend(page["images"])
     return "\n".join(texts), images
 
+def format_sources(payloads: List[Dict[str, Any]], max_occurrences: int = 3) -> List[str]:
+    """
+    One citation per source, in order of first appearance, with the (1-based) pages used.
+    A repeated image cites its own page plus at most max_occurrences of its other pages, so a
+    logo on every page doesn't turn into dozens of citations.
+    """
+    pages: Dict[str, set] = {}
+    for p in payloads:
+        occurrences = [p] + list(p.get("occurrences") or [])[:max_occurrences]
+        for occ in occurrences:
+            src = occ.get("source", "unknown")
+            found = pages.setdefault(src, set())
+            if occ.get("page") is not None:
+                found.add(int(occ["page"]))
+    out = []
+    for src, pnos in pages.items():
+        if pnos:
+            out.append(f"{src} (p. {', '.join(str(n + 1) for n in sorted(pnos))})")
+        else:
+            out.append(src)
+    return out
+
 def load_text_from_plain(path: str) -> str:
     return pathlib.Path(path).read_text(encoding="utf-8", errors="ignore")
 
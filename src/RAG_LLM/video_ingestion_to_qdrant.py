@@ -11,9 +11,21 @@ from qdrant_client import QdrantClient, models
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import ContentCache, content_key, resolve_config_path
+from retriever import update_local_indexes
+from bulk_upload import build_uploader
 
 
-def extract_entities_with_ollama(video_data, client, model_name="phi3"):
+def default_entities(video_data):
+    return {
+        "machine_name": ["General"],
+        "exercise_name": [video_data.get('title', 'Unknown Exercise')],
+        "body_parts": []
+    }
+
+
+def extract_entities_with_ollama(video_data, client, model_name="phi3", raise_errors=False):
     """
     Uses a local Ollama model to extract structured entities.
     """
@@ -42,22 +54,15 @@ def extract_entities_with_ollama(video_data, client, model_name="phi3"):
         extracted_data = json.loads(response.choices[0].message.content)
         
         # Validate and clean the data
-        validated_data = {
-            "machine_name": extracted_data.get("machine_name", []) or ["General"],
-            "exercise_name": extracted_data.get("exercise_name", ["Unknown Exercise"]),
-            "body_parts": extracted_data.get("body_parts", [])
-        }
-        return validated_data
+        return validate_entities(extracted_data, video_data)
 
     except Exception as e:
         print(f"\n[ERROR] Ollama entity extraction failed: {e}")
-        return {
-            "machine_name": ["General"],
-            "exercise_name": [video_data.get('title', 'Unknown Exercise')],
-            "body_parts": []
-        }
+        if raise_errors:
+            raise
+        return default_entities(video_data)
     
-def extract_entities_with_gemini(video_data, model):
+def extract_entities_with_gemini(video_data, model, raise_errors=False):
     text_content = f"Title: {video_data.get('title', '')}\nDescription: {video_data.get('description', '')}"
     
     json_format_instructions = """
@@ -92,17 +97,163 @@ def extract_entities_with_gemini(video_data, model):
         response = model.generate_content(prompt)
         json_string = response.text.strip().replace("```json", "").replace("```", "").strip()
         extracted_data = json.loads(json_string)
-        
-        validated_data = {
-            "machine_name": extracted_data.get("machine_name", []) or ["General"],
-            "exercise_name": extracted_data.get("exercise_name", ["Unknown Exercise"]),
-            "body_parts": extracted_data.get("body_parts", [])
-        }
-        return validated_data
+        return validate_entities(extracted_data, video_data)
         
     except Exception as e:
         print(f"\n[ERROR] Gemini entity extraction failed: {e}")
-        return { "machine_name": ["General"], "exercise_name": [video_data.get('title', 'Unknown Exercise')], "body_parts": [] }
+        if raise_errors:
+            raise
+        return default_entities(video_data)
+
+def validate_entities(extracted_data, video_data):
+    return {
+        "machine_name": extracted_data.get("machine_name", []) or ["General"],
+        "exercise_name": extracted_data.get("exercise_name", ["Unknown Exercise"]),
+        "body_parts": extracted_data.get("body_parts", [])
+    }
+
+
+def build_batch_prompt(videos):
+    """One prompt for several videos; the model answers with a JSON object keyed by video id."""
+    video_blocks = "\n".join(
+        f"[{vid}]\nTitle: {v.get('title', '')}\nDescription: {v.get('description', '')}\n" for vid, v in videos
+    )
+    return f"""
+    You are an expert sports scientist. Your task is to extract fitness entities from each of the following videos.
+    Provide the output ONLY as a valid JSON object whose keys are the video ids in square brackets (without the brackets).
+    Each value must be an object with the keys "machine_name", "exercise_name", "body_parts", each a list of strings.
+    If no specific machine is mentioned, use an empty list for "machine_name". "body_parts" lists the primary muscles targeted.
+    Do not include any other text, explanations, or markdown formatting.
+
+    Videos to Analyze:
+    ---
+    {video_blocks}
+    ---
+    """
+
+
+def parse_batch_response(text, videos):
+    """Maps video id -> raw entity dict; accepts an object keyed by id or an array of objects with "video_id"."""
+    data = json.loads(text.strip().replace("```json", "").replace("```", "").strip())
+    if isinstance(data, list):
+        data = {str(item.get("video_id")): item for item in data if isinstance(item, dict)}
+    if isinstance(data, dict) and len(videos) == 1 and videos[0][0] not in data and "machine_name" in data:
+        data = {videos[0][0]: data}
+    return {vid: data[vid] for vid, _ in videos if isinstance(data, dict) and isinstance(data.get(vid), dict)}
+
+
+def extract_entities_batch(videos, client, mode, model_name="phi3"):
+    """
+    Entities for several (video id, video_data) pairs in one LLM round trip. Videos the model
+    skipped or mangled are retried one at a time with the single-video extractors; those that
+    still fail get default entities and are listed in the returned `failed` set.
+    """
+    prompt = build_batch_prompt(videos)
+    try:
+        if mode == "gemini":
+            raw = client.generate_content(prompt).text
+        else:
+            response = client.chat.completions.create(
+                model=model_name,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.0,
+                response_format={"type": "json_object"}
+            )
+            raw = response.choices[0].message.content
+        extracted = parse_batch_response(raw, videos)
+    except Exception as e:
+        print(f"\n[ERROR] Batch entity extraction failed for {len(videos)} videos: {e}")
+        extracted = {}
+
+    results, failed = {}, set()
+    for vid, video_data in videos:
+        if vid in extracted:
+            results[vid] = validate_entities(extracted[vid], video_data)
+            continue
+        try:
+            if mode == "gemini":
+                results[vid] = extract_entities_with_gemini(video_data, client, raise_errors=True)
+            else:
+                results[vid] = extract_entities_with_ollama(video_data, client, model_name, raise_errors=True)
+        except Exception:
+            results[vid] = default_entities(video_data)
+            failed.add(vid)
+    return results, failed
+
+
+def extract_all_entities(videos, client, mode, batch_size=8, in_flight=4, cache=None):
+    """
+    Entities for every video (same order), with up to `in_flight` multi-video requests running
+    concurrently. Videos whose title+description is in the cache are not sent at all.
+    Also returns the indexes of videos that only got default entities.
+    """
+    keys = [content_key(v.get("title", ""), v.get("description", "")) for v in videos]
+    known = cache.get_many(keys) if cache is not None else {}
+    todo = {}
+    for k, v in zip(keys, videos):
+        if k not in known and k not in todo:
+            todo[k] = v
+    todo = list(todo.items())
+    print(f"Entities: {len(videos) - len(todo)} of {len(videos)} videos cached, {len(todo)} to extract "
+          f"({batch_size} per request, {in_flight} in flight)")
+
+    def run_batch(batch):
+        # Short ids in the prompt (v0, v1, ...) are easier for the model to echo than hashes
+        labelled = [(f"v{j}", v) for j, (_, v) in enumerate(batch)]
+        extracted, failed = extract_entities_batch(labelled, client, mode)
+        results = {k: extracted[f"v{j}"] for j, (k, _) in enumerate(batch)}
+        return results, {k for j, (k, _) in enumerate(batch) if f"v{j}" in failed}
+
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    failed_keys = set()
+    with ThreadPoolExecutor(max_workers=max(1, in_flight)) as pool:
+        futures = [pool.submit(run_batch, batch) for batch in batches]
+        for fut in tqdm(as_completed(futures), total=len(futures), desc="Extracting entities"):
+            fresh, failed = fut.result()
+            # Defaults from a failed extraction (LLM down, timeout) are used for this run only,
+            # so the next run retries those videos instead of reading the defaults back
+            if cache is not None:
+                cache.put_many({k: v for k, v in fresh.items() if k not in failed})
+            known.update(fresh)
+            failed_keys |= failed
+    failed = {i for i, k in enumerate(keys) if k in failed_keys}
+    if failed:
+        print(f"[WARN] Entity extraction failed for {len(failed)} videos; using defaults (not cached)")
+    return [known[k] for k in keys], failed
+
+
+# Fixed namespace: the same (video URL, chunk index) always maps to the same point id
+VIDEO_POINT_NAMESPACE = uuid.UUID("0d6c8f5e-3b7a-4c1e-9f2d-8a4b6e1c7d35")
+
+
+def video_point_id(video_url, chunk_index):
+    return str(uuid.uuid5(VIDEO_POINT_NAMESPACE, f"{video_url}|{chunk_index}"))
+
+
+def video_content_hash(video_data):
+    # Everything the points are built from: transcript (chunks) and title/description (entities)
+    return content_key(video_data.get('transcript', ''), video_data.get('title', ''), video_data.get('description', ''))
+
+
+def indexed_videos(client, collection_name, batch_size=1000):
+    """video_url -> {"hash", "ids"} for what is already in the collection (no vectors fetched)."""
+    videos = {}
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection_name, limit=batch_size, offset=offset,
+            with_payload=["video_url", "content_hash"], with_vectors=False,
+        )
+        for r in records:
+            payload = r.payload or {}
+            entry = videos.setdefault(payload.get("video_url"), {"hash": payload.get("content_hash"), "ids": []})
+            if entry["hash"] != payload.get("content_hash"):
+                entry["hash"] = None  # mixed versions (or points from before hashing): treat as changed
+            entry["ids"].append(str(r.id))
+        if offset is None:
+            break
+    return videos
+
 
 def chunk_text(text, sentences_per_chunk=5):
     sentences = nltk.sent_tokenize(text)
@@ -113,6 +264,7 @@ def chunk_text(text, sentences_per_chunk=5):
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--full", action="store_true", help="Drop and recreate the collection instead of updating it incrementally")
     args = ap.parse_args()
     cfg = yaml.safe_load(open(args.config))
 
@@ -165,83 +317,145 @@ if __name__ == "__main__":
 
     print(f"Setting up Qdrant collection: '{QDRANT_COLLECTION_NAME}'")
 
-    if qdrant_client.collection_exists(collection_name=QDRANT_COLLECTION_NAME):
-        print(f"Collection '{QDRANT_COLLECTION_NAME}' already exists. Deleting it to start fresh.")
+    if args.full and qdrant_client.collection_exists(collection_name=QDRANT_COLLECTION_NAME):
+        print(f"Collection '{QDRANT_COLLECTION_NAME}' already exists. Deleting it to start fresh (--full).")
         qdrant_client.delete_collection(collection_name=QDRANT_COLLECTION_NAME)
 
-    print(f"Creating new collection: '{QDRANT_COLLECTION_NAME}'")
-    qdrant_client.create_collection(
-        collection_name=QDRANT_COLLECTION_NAME,
-        vectors_config= models.VectorParams(size=VECTOR_DIMENSION, distance=models.Distance.COSINE)
-    )
-    
-    # --- NEW: CREATE PAYLOAD INDEXES ---
-    print("Creating payload indexes for filtering...")
-    # Index for machine_name
-    qdrant_client.create_payload_index(
-        collection_name=QDRANT_COLLECTION_NAME,
-        field_name="machine_name",
-        field_schema="keyword"
-    )
-    # Index for body_parts
-    qdrant_client.create_payload_index(
-        collection_name=QDRANT_COLLECTION_NAME,
-        field_name="body_parts",
-        field_schema="keyword"
-    )
-    # Index for exercise_name (good practice to add it too)
-    qdrant_client.create_payload_index(
-        collection_name=QDRANT_COLLECTION_NAME,
-        field_name="exercise_name",
-        field_schema="keyword"
-    )
-    print("Payload indexes created successfully.")
+    if not qdrant_client.collection_exists(collection_name=QDRANT_COLLECTION_NAME):
+        print(f"Creating new collection: '{QDRANT_COLLECTION_NAME}'")
+        qdrant_client.create_collection(
+            collection_name=QDRANT_COLLECTION_NAME,
+            vectors_config= models.VectorParams(size=VECTOR_DIMENSION, distance=models.Distance.COSINE)
+        )
+
+        # --- NEW: CREATE PAYLOAD INDEXES ---
+        print("Creating payload indexes for filtering...")
+        # Index for machine_name
+        qdrant_client.create_payload_index(
+            collection_name=QDRANT_COLLECTION_NAME,
+            field_name="machine_name",
+            field_schema="keyword"
+        )
+        # Index for body_parts
+        qdrant_client.create_payload_index(
+            collection_name=QDRANT_COLLECTION_NAME,
+            field_name="body_parts",
+            field_schema="keyword"
+        )
+        # Index for exercise_name (good practice to add it too)
+        qdrant_client.create_payload_index(
+            collection_name=QDRANT_COLLECTION_NAME,
+            field_name="exercise_name",
+            field_schema="keyword"
+        )
+        # Index for video_url (incremental updates look videos up by URL)
+        qdrant_client.create_payload_index(
+            collection_name=QDRANT_COLLECTION_NAME,
+            field_name="video_url",
+            field_schema="keyword"
+        )
+        print("Payload indexes created successfully.")
+
     print(f"Processing data from '{INPUT_JSONL_FILE}'...")
-    points_to_upload = []
+    videos = {}
     with open(INPUT_JSONL_FILE, 'r', encoding='utf-8') as f:
-        for line in tqdm(f, desc="Processing videos"):
-            video_data = json.loads(line)
-            if not video_data.get('transcript'):
+        for v in (json.loads(line) for line in f if line.strip()):
+            if not v.get('transcript'):
                 continue
+            if not v.get('url'):
+                print(f"[WARN] Skipping video without a URL: '{v.get('title')}'")
+                continue
+            if v['url'] in videos:
+                print(f"[WARN] Duplicate video URL in input, keeping the first: {v['url']}")
+                continue
+            videos[v['url']] = v
+
+    # Incremental: compare content hashes with what is indexed; only new/changed videos are
+    # extracted and embedded, and videos no longer in the JSONL are deleted
+    indexed = indexed_videos(qdrant_client, QDRANT_COLLECTION_NAME)
+    changed = [v for url, v in videos.items() if indexed.get(url, {}).get("hash") != video_content_hash(v)]
+    removed = [url for url in indexed if url not in videos]
+    print(f"Videos: {len(videos)} in input, {len(changed)} new/changed, {len(removed)} removed, "
+          f"{len(videos) - len(changed)} unchanged")
 
-            if EXTRACTION_MODE == "gemini":
-                entities = extract_entities_with_gemini(video_data, entity_extraction_client)
-            else: 
-                entities = extract_entities_with_ollama(video_data, entity_extraction_client)
-            
-            # print(entities)
-            
-            transcript_chunks = chunk_text(video_data['transcript'])
-
-            for chunk in transcript_chunks:
-                payload = {
-                    "text": chunk,
-                    "video_url": video_data.get('url'),
-                    "video_title": video_data.get('title'),
-                    "machine_name": entities["machine_name"],
-                    "body_parts": entities["body_parts"],
-                    "exercise_name": entities["exercise_name"]
-                }
-                point = {"id": str(uuid.uuid4()), "payload": payload}
-                points_to_upload.append(point)
+    # Entity extraction: multi-video prompts, several requests in flight, cached on disk by
+    # title+description so re-runs only pay for new or edited videos
+    video_cfg = cfg.get("video_ingest", {})
+    entity_cache = ContentCache(
+        resolve_config_path(args.config, video_cfg.get("entity_cache_path", "indexes/content_cache.sqlite")),
+        f"entities:{EXTRACTION_MODE}",
+    )
+    all_entities, failed_entities = extract_all_entities(
+        changed, entity_extraction_client, EXTRACTION_MODE,
+        batch_size=int(video_cfg.get("entity_batch_size", 8)),
+        in_flight=int(video_cfg.get("entity_in_flight", 4)),
+        cache=entity_cache,
+    )
+
+    points_to_upload = []
+    for n, (video_data, entities) in enumerate(tqdm(zip(changed, all_entities), total=len(changed), desc="Processing videos")):
+        transcript_chunks = chunk_text(video_data['transcript'])
+        # No hash when the entities are defaults: the next run sees the video as changed and retries
+        content_hash = None if n in failed_entities else video_content_hash(video_data)
+
+        for chunk_index, chunk in enumerate(transcript_chunks):
+            payload = {
+                "text": chunk,
+                "video_url": video_data.get('url'),
+                "video_title": video_data.get('title'),
+                "machine_name": entities["machine_name"],
+                "body_parts": entities["body_parts"],
+                "exercise_name": entities["exercise_name"],
+                "chunk_index": chunk_index,
+                "content_hash": content_hash
+            }
+            point = {"id": video_point_id(video_data['url'], chunk_index), "payload": payload}
+            points_to_upload.append(point)
 
     if points_to_upload:
         print(f"Prepared {len(points_to_upload)} points. Generating embeddings and uploading...")
         
         chunk_texts = [point["payload"]["text"] for point in points_to_upload]
-        vectors = embedding_model.encode(chunk_texts, show_progress_bar=True)
-        
-        for i, point in enumerate(points_to_upload):
-            point["vector"] = vectors[i].tolist()
-            
-        qdrant_client.upsert(
+        vectors = embedding_model.encode(chunk_texts, show_progress_bar=True, convert_to_numpy=True)
+
+        # Parallel batched upload straight from the NumPy array (settings under `ingest:` in config)
+        uploader = build_uploader(qdrant_client, QDRANT_COLLECTION_NAME, cfg)
+        try:
+            uploader.upload([p["id"] for p in points_to_upload], vectors, [p["payload"] for p in points_to_upload])
+        finally:
+            uploader.close()
+
+    # Old points of changed videos that weren't overwritten (shorter transcript, pre-hash ids)
+    # and every point of removed videos
+    new_ids = {p["id"] for p in points_to_upload}
+    stale_ids = [pid for v in changed for pid in indexed.get(v['url'], {}).get("ids", []) if pid not in new_ids]
+    stale_ids += [pid for url in removed for pid in indexed[url]["ids"]]
+    batch_size = int(cfg.get("ingest", {}).get("upsert_batch", 500))
+    for i in range(0, len(stale_ids), batch_size):
+        qdrant_client.delete(
             collection_name=QDRANT_COLLECTION_NAME,
-            points=[models.PointStruct(**point) for point in points_to_upload],
-            wait=True
+            points_selector=models.PointIdsList(points=stale_ids[i:i + batch_size]),
         )
-        
-        print(f"--- Ingestion Complete! ---")
-        print(f"Successfully uploaded {len(points_to_upload)} points to Qdrant collection '{QDRANT_COLLECTION_NAME}'.")
-    else:
-        print("No data was processed or uploaded.")
+    if stale_ids:
+        print(f"Deleted {len(stale_ids)} stale points.")
 
+    if not points_to_upload and not stale_ids:
+        print("No changes; nothing was uploaded or deleted.")
+
+    # Apply this run to the local FAISS index (in-process retrieval) and the BM25 index that
+    # video_query's hybrid retriever loads; overwritten ids are replaced too. A missing index
+    # (or --full) is rebuilt from the whole collection.
+    index_dir = resolve_config_path(args.config, cfg["index"].get("local_dir", "indexes"))
+    has_changes = bool(points_to_upload or stale_ids)
+    update_local_indexes(
+        qdrant_client, QDRANT_COLLECTION_NAME, index_dir, cfg,
+        remove_ids=stale_ids + list(new_ids),
+        add_ids=[p["id"] for p in points_to_upload],
+        add_vectors=vectors if points_to_upload else None,
+        add_payloads=[p["payload"] for p in points_to_upload],
+        full=args.full,
+    )
+
+    if has_changes:
+        print(f"--- Ingestion Complete! ---")
+        print(f"Uploaded {len(points_to_upload)} points and deleted {len(stale_ids)} from Qdrant collection '{QDRANT_COLLECTION_NAME}'.")
@@ -1,14 +1,21 @@
 import os
 import json
+import numpy as np
 from fastapi import FastAPI, HTTPException
 from openai import OpenAI
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
-from qdrant_client import QdrantClient, models as qdrant_models
+from qdrant_client import QdrantClient
 from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
 from dotenv import load_dotenv
+from utils import load_config
+from retriever import build_retriever
+from reranker import build_reranker
+from embedding_cache import CachedEncoder, build_query_cache
+from batching import build_batcher
+from prefetch import PrefetchCache, rank_by_similarity
 
 
 QDRANT_COLLECTION_NAME = "fitness_videos_rag"
@@ -19,6 +26,11 @@ class QueryRequest(BaseModel):
     """Defines the structure of an incoming query from the front-end."""
     query: str = Field(..., description="The combined text query from the user's voice and the detected object.")
     seen_video_urls: Optional[List[str]] = Field(default_factory=list, description="A list of video URLs already shown to the user in this session.")
+    target_object: Optional[str] = Field(None, description="The detected object, used to look up a speculatively prefetched candidate set.")
+
+class PrefetchRequest(BaseModel):
+    """Sent by the gateway as soon as the crosshair target changes, before the user speaks."""
+    target_object: str
 
 class VideoResponse(BaseModel):
     """Defines the structure of the video response sent back to the front-end."""
@@ -37,6 +49,8 @@ QUERY_MODE = "ollama"
 qdrant_url = os.getenv("QDRANT_URL")
 qdrant_api_key = os.getenv("QDRANT_API_KEY")
 google_api_key = os.getenv("GOOGLE_API_KEY")
+CONFIG_PATH = os.getenv("CONFIG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config.yaml"))
+cfg = load_config(CONFIG_PATH)
 
 print(f"--- Initializing in <{QUERY_MODE.upper()}> mode ---")
 
@@ -69,6 +83,17 @@ print("Initializing clients (Qdrant, SentenceTransformer, Gemini)...")
 
 qdrant_client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
 embedding_model = SentenceTransformer(EMBED_MODEL_NAME, device="cuda" if "cuda" in "cuda" else "cpu")
+# "Next Video" requests resend the same query text, so they are served from this cache.
+# Concurrent requests (handled on FastAPI's worker threads) share batched encoder passes.
+query_encoder = CachedEncoder(embedding_model, EMBED_MODEL_NAME, build_query_cache(cfg), normalize=False,
+                              batcher=build_batcher(cfg, embedding_model, normalize=False))
+retriever = build_retriever(cfg, CONFIG_PATH, QDRANT_COLLECTION_NAME, qdrant_client=qdrant_client)
+reranker = build_reranker(cfg)
+RERANK_CANDIDATES = int(cfg.get("retrieval", {}).get("top_k_text", 40))
+prefetch_cache = PrefetchCache(
+    ttl_seconds=float(cfg.get("prefetch", {}).get("ttl_seconds", 120)),
+    max_entries=int(cfg.get("prefetch", {}).get("max_entries", 256)),
+)
 
 genai.configure(api_key=google_api_key)
 generation_config = genai.GenerationConfig(response_mime_type="application/json")
@@ -156,6 +181,48 @@ def deduce_platform_from_url(url: str) -> str:
         return "Instagram"
     return "Unknown"
 
+def pick_unseen_video(search_results, seen_video_urls: List[str]) -> Optional[VideoResponse]:
+    """Returns the best-ranked result the user hasn't been shown yet, if any."""
+    for result in search_results:
+        video_url = result.payload.get("video_url")
+        if video_url and video_url not in seen_video_urls:
+            platform = deduce_platform_from_url(video_url)
+            print(f"[RESULT] Found top unseen result: '{result.payload.get('video_title')}' with score {result.score:.4f}")
+            
+            return VideoResponse(
+                video_url=video_url,
+                embed_url=create_embeddable_url(video_url),
+                video_title=result.payload.get("video_title", "No Title"),
+                expert_name=result.payload.get("expert_name", "Unknown Expert"),
+                platform=platform,
+                text_chunk=result.payload.get("text", "")
+            )
+    return None
+
+# --- SPECULATIVE PREFETCH ---
+@app.post("/prefetch")
+def prefetch_candidates(request: PrefetchRequest):
+    """
+    Precomputes the top candidate videos for a target object, so the follow-up /query only
+    has to rank this set.
+    """
+    if prefetch_cache.get(request.target_object) is not None:
+        return {"status": "cached", "target_object": request.target_object}
+
+    # Encoded outside the query embedding cache: /query looks up "<user text> <target>", never
+    # the bare target, so caching this vector would only evict useful entries.
+    target_vector = embedding_model.encode([request.target_object], normalize_embeddings=False, convert_to_numpy=True)[0]
+    hits = retriever.search(target_vector, limit=RERANK_CANDIDATES, query_text=request.target_object)
+    # Chunk embeddings let /query rank the set without another index lookup when there is no reranker.
+    # They are read back from the index rather than re-encoded, so speculative work stays off the
+    # encoder that live queries use.
+    chunk_vectors = retriever.vectors([h.id for h in hits]) if hits else np.zeros((0, target_vector.shape[0]))
+    if chunk_vectors is None:
+        chunk_vectors = embedding_model.encode([h.payload.get("text", "") for h in hits], convert_to_numpy=True)
+    prefetch_cache.put(request.target_object, hits, chunk_vectors)
+    print(f"[PREFETCH] Cached {len(hits)} candidates for '{request.target_object}'")
+    return {"status": "prefetched", "target_object": request.target_object, "candidates": len(hits)}
+
 # --- THE MAIN API ENDPOINT ---
 @app.post("/query", response_model=VideoResponse)
 def query_videos(request: QueryRequest):
@@ -166,6 +233,20 @@ def query_videos(request: QueryRequest):
     print(f"\n[REQUEST] Received query: '{request.query}'")
     print(f"[REQUEST] Excluding seen URLs: {request.seen_video_urls}")
 
+    # Step 0: If the gateway already prefetched candidates for this target, just rank that set.
+    prefetched = prefetch_cache.get(request.target_object) if request.target_object else None
+    if prefetched is not None and prefetched.hits:
+        query_vector = query_encoder.encode(request.query)
+        if reranker is not None:
+            ranked = reranker.rerank(request.query, prefetched.hits, top_n=len(prefetched.hits))
+        else:
+            ranked = rank_by_similarity(prefetched, query_vector)
+        video = pick_unseen_video(ranked, request.seen_video_urls)
+        if video is not None:
+            print(f"[PREFETCH] Served from prefetched set for '{request.target_object}'")
+            return video
+        print("[PREFETCH] Prefetched set exhausted; falling back to a full search.")
+
     # Step 1: Analyze the query to extract structured entities for filtering.
     if QUERY_MODE == "gemini":
         # This will fail until your daily quota resets
@@ -175,51 +256,42 @@ def query_videos(request: QueryRequest):
 
     print(f"[ANALYSIS] Extracted Entities: {entities}")
 
-    # Step 2: Build a robust metadata filter for Qdrant.
+    # Step 2: Build a robust metadata filter (a Qdrant `should` filter: any listed field may match).
     # This filter ensures we only search within a factually correct subset of our data.
-    filter_conditions = []
+    should = {}
     if entities.get("machine_name"):
-        filter_conditions.append(qdrant_models.FieldCondition(
-            key="machine_name", match=qdrant_models.MatchAny(any=entities["machine_name"])
-        ))
+        should["machine_name"] = entities["machine_name"]
     if entities.get("body_parts"):
-        filter_conditions.append(qdrant_models.FieldCondition(
-            key="body_parts", match=qdrant_models.MatchAny(any=entities["body_parts"])
-        ))
-    
-    query_filter = qdrant_models.Filter(should=filter_conditions) if filter_conditions else None
-    print(f"[FILTER] Constructed Qdrant Filter: {query_filter}")
+        should["body_parts"] = entities["body_parts"]
+    print(f"[FILTER] Constructed filter: {should or None}")
 
     # Step 3: Convert the user's natural language query into a vector embedding.
-    query_vector = embedding_model.encode(request.query).tolist()
+    query_vector = query_encoder.encode(request.query)
 
-    # Step 4: Perform the hybrid search in Qdrant.
+    # Step 4: Perform the hybrid search on the configured backend (Qdrant or local FAISS).
     # We retrieve more (limit=15) than we need to have fallbacks if the top results have been seen.
-    search_results = qdrant_client.search(
-        collection_name=QDRANT_COLLECTION_NAME,
-        query_vector=query_vector,
-        query_filter=query_filter,
-        limit=15,
-        with_payload=True
-    )
+    if reranker is not None:
+        # With a reranker, over-fetch and reorder the whole candidate set by cross-encoder score.
+        candidates = retriever.search(query_vector, limit=RERANK_CANDIDATES, should=should or None, query_text=request.query)
+        search_results = reranker.rerank(request.query, candidates, top_n=len(candidates))
+    else:
+        search_results = retriever.search(query_vector, limit=15, should=should or None, query_text=request.query)
 
     # Step 5: Iterate through the ranked results and find the first one the user hasn't seen.
-    for result in search_results:
-        video_url = result.payload.get("video_url")
-        if video_url and video_url not in request.seen_video_urls:
-            platform = deduce_platform_from_url(video_url)
-            print(f"[RESULT] Found top unseen result: '{result.payload.get('video_title')}' with score {result.score:.4f}")
-            
-            return VideoResponse(
-                video_url=video_url,
-                embed_url=create_embeddable_url(video_url),
-                video_title=result.payload.get("video_title", "No Title"),
-                expert_name=result.payload.get("expert_name", "Unknown Expert"),
-                platform=platform,
-                text_chunk=result.payload.get("text", "")
-            )
+    video = pick_unseen_video(search_results, request.seen_video_urls)
+    if video is not None:
+        return video
 
     # Step 6: If the loop completes, no new videos were found.
     print("[RESPONSE] No new relevant videos found for this query.")
     raise HTTPException(status_code=404, detail="No new relevant videos were found. You may have seen them all.")
 
+
+@app.get("/stats")
+def stats():
+    """Cache counters for monitoring."""
+    return {
+        "query_embedding_cache": query_encoder.cache.stats(),
+        "embedding_batcher": query_encoder.batcher.stats() if query_encoder.batcher is not None else None,
+        "prefetch_cache": prefetch_cache.stats(),
+    }
@@ -0,0 +1,89 @@
+# In-memory audio decoding for Whisper: uploaded bytes -> 16 kHz mono float32, one ffmpeg
+# process over pipes, no temporary files.
+import os
+import asyncio
+import subprocess
+import numpy as np
+
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "E:/XRAI/XR_RAG_LLM/ffmpeg/bin/ffmpeg.exe")
+SAMPLE_RATE = 16000  # what Whisper expects
+
+
+def ffmpeg_pcm_command(sample_rate: int = SAMPLE_RATE) -> list:
+    """ffmpeg reading any container from stdin and writing raw PCM16 mono to stdout."""
+    return [
+        FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sample_rate),
+        "pipe:1",
+    ]
+
+
+def pcm16_to_float32(pcm: bytes) -> np.ndarray:
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def decode_audio_bytes(audio_bytes: bytes, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decodes any ffmpeg-readable audio (webm/opus from MediaRecorder, wav, mp3, ...) to a
+    float32 array in [-1, 1], ready to pass straight to `model.transcribe`.
+    """
+    try:
+        proc = subprocess.run(ffmpeg_pcm_command(sample_rate), input=audio_bytes, capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg failed to decode audio: {e.stderr.decode(errors='ignore').strip()}") from e
+    return pcm16_to_float32(proc.stdout)
+
+
+class StreamingDecoder:
+    """
+    Incremental decode for a streamed recording (e.g. MediaRecorder timeslices): chunks are
+    piped into one long-running ffmpeg process as they arrive, and PCM is collected from its
+    stdout concurrently, so only the tail is left to decode when the stream ends.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.proc = None
+        self._pcm = bytearray()
+        self._reader = None
+        self.bytes_in = 0
+
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            *ffmpeg_pcm_command(self.sample_rate),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.create_task(self._read_stdout())
+        return self
+
+    async def _read_stdout(self):
+        while True:
+            data = await self.proc.stdout.read(65536)
+            if not data:
+                return
+            self._pcm.extend(data)
+
+    @property
+    def decoded_seconds(self) -> float:
+        return len(self._pcm) / 2 / self.sample_rate
+
+    async def feed(self, chunk: bytes):
+        self.bytes_in += len(chunk)
+        self.proc.stdin.write(chunk)
+        await self.proc.stdin.drain()
+
+    async def finish(self) -> np.ndarray:
+        """Closes the input and returns every decoded sample as float32."""
+        self.proc.stdin.close()
+        await self._reader
+        await self.proc.wait()
+        usable = len(self._pcm) - len(self._pcm) % 2
+        return pcm16_to_float32(bytes(self._pcm[:usable]))
+
+    async def abort(self):
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.kill()
+            await self.proc.wait()
@@ -0,0 +1,174 @@
+# Whisper replicas in worker processes behind a bounded queue. When the queue is full,
+# callers get PoolSaturated (-> 503 + Retry-After) instead of piling up without limit.
+# The bound counts requests: a request is admitted once, and all of its VAD segments run
+# under that admission.
+import os
+import time
+import contextlib
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+_worker_model = None
+
+
+def _init_worker(model_name: str):
+    global _worker_model
+    import whisper
+    _worker_model = whisper.load_model(model_name)
+
+
+def _warm_up_worker(seconds: float = 1.0):
+    # One pass over silence, so the first real request doesn't pay for lazy CUDA/kernel setup
+    _worker_model.transcribe(np.zeros(int(16000 * seconds), dtype=np.float32), fp16=False)
+    return os.getpid()
+
+
+def _transcribe_in_worker(audio: np.ndarray, submitted_at: float):
+    started_at = time.time()
+    result = _worker_model.transcribe(audio, fp16=False)
+    return result["text"].strip(), started_at - submitted_at, time.time() - started_at
+
+
+class PoolSaturated(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Transcription queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class WhisperPool:
+    def __init__(self, model_name: str = "small", workers: int = 1, max_queue: int = 8, window: int = 1000):
+        self.model_name = model_name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = self._make_executor()
+        self._lock = threading.Lock()
+        self._requests = 0   # admitted requests, bounded by workers + max_queue
+        self._in_flight = 0  # segments submitted to the replicas
+        self._waits = deque(maxlen=window)
+        self._runs = deque(maxlen=window)
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.restarts = 0
+        print(f"[Whisper] Pool started: {workers} x '{model_name}', queue limit {max_queue}")
+
+    def _make_executor(self) -> ProcessPoolExecutor:
+        # spawn: each replica loads its own model, and torch doesn't survive fork well
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_name,),
+        )
+
+    async def warm_up(self):
+        """Starts every replica and runs one pass each, so load time stays out of request metrics."""
+        started = time.time()
+        # Submitted together, each job finds no idle worker and spawns its own process
+        futs = [self.executor.submit(_warm_up_worker) for _ in range(self.workers)]
+        pids = await asyncio.gather(*(asyncio.wrap_future(f) for f in futs))
+        print(f"[Whisper] Warmed up {len(set(pids))} replica(s) in {time.time() - started:.1f}s")
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        # A crashed worker (OOM, segfault) breaks the whole executor; replace it once, even if
+        # several in-flight calls see the same failure
+        with self._lock:
+            if self.executor is not broken:
+                return
+            self.executor = self._make_executor()
+            self.restarts += 1
+        print("[Whisper] A worker process died; replica pool recreated")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._requests - self.workers)
+
+    def retry_after(self) -> int:
+        # Rough time for the current backlog to drain, at least one second.
+        with self._lock:
+            mean_run = (sum(self._runs) / len(self._runs)) if self._runs else 2.0
+            backlog = self.queue_depth + 1
+        return max(1, int(round(mean_run * backlog / self.workers)))
+
+    def has_capacity(self) -> bool:
+        with self._lock:
+            return self._requests < self.workers + self.max_queue
+
+    def _reserve(self):
+        with self._lock:
+            if self._requests >= self.workers + self.max_queue:
+                self.rejected += 1
+                saturated = True
+            else:
+                self._requests += 1
+                saturated = False
+        if saturated:
+            raise PoolSaturated(self.retry_after())
+
+    @contextlib.contextmanager
+    def admit(self):
+        """Holds one request slot for a whole request (every segment); raises PoolSaturated when full."""
+        self._reserve()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._requests -= 1
+
+    async def transcribe(self, audio: np.ndarray) -> str:
+        """Transcribes one segment; call inside admit() so the request is counted against the queue."""
+        with self._lock:
+            self._in_flight += 1
+        executor = self.executor
+        try:
+            fut = executor.submit(_transcribe_in_worker, audio, time.time())
+            text, wait_s, run_s = await asyncio.wrap_future(fut)
+        except BrokenProcessPool:
+            with self._lock:
+                self.failed += 1
+            self._restart(executor)
+            raise
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        with self._lock:
+            self._waits.append(wait_s)
+            self._runs.append(run_s)
+            self.completed += 1
+        return text
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+
+            def pct(p):
+                return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+            return {
+                "model": self.model_name,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "requests": self._requests,
+                "in_flight": self._in_flight,
+                "queue_depth": self.queue_depth,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "restarts": self.restarts,
+                "wait_s": {"p50": pct(0.50), "p95": pct(0.95), "max": waits[-1] if waits else 0.0},
+                "mean_run_s": (sum(self._runs) / len(self._runs)) if self._runs else 0.0,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,47 @@
+# Reusable KaldiRecognizers for the Vosk server. Building a recognizer per connection costs
+# more than a stream's first seconds of audio, so idle ones are Reset() and kept per sample rate.
+import threading
+from collections import defaultdict
+from vosk import KaldiRecognizer
+
+
+class RecognizerPool:
+    def __init__(self, model, max_idle_per_rate: int = 16):
+        self.model = model
+        self.max_idle_per_rate = max_idle_per_rate
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.in_use = 0
+
+    def acquire(self, sample_rate: int):
+        with self._lock:
+            idle = self._idle[sample_rate]
+            rec = idle.pop() if idle else None
+            self.in_use += 1
+            if rec is not None:
+                self.reused += 1
+        if rec is None:
+            rec = KaldiRecognizer(self.model, sample_rate)
+            with self._lock:
+                self.created += 1
+        return rec
+
+    def release(self, sample_rate: int, rec):
+        """Resets the recognizer for the next stream; call only once no decode is running on it."""
+        rec.Reset()
+        with self._lock:
+            self.in_use -= 1
+            idle = self._idle[sample_rate]
+            if len(idle) < self.max_idle_per_rate:
+                idle.append(rec)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_use": self.in_use,
+                "idle": {rate: len(recs) for rate, recs in self._idle.items()},
+                "created": self.created,
+                "reused": self.reused,
+            }
@@ -0,0 +1,124 @@
+# Voice activity detection before Whisper: trims silence, drops pauses, and groups speech
+# into segments that can be transcribed in parallel.
+import os
+from typing import List, NamedTuple, Tuple
+import numpy as np
+
+try:
+    import webrtcvad
+except Exception:
+    webrtcvad = None
+
+VAD_BACKEND = "webrtcvad" if webrtcvad is not None else "energy"
+
+FRAME_MS = 30
+VAD_AGGRESSIVENESS = int(os.getenv("VAD_AGGRESSIVENESS", 2))     # webrtcvad mode 0-3
+VAD_MERGE_GAP_MS = int(os.getenv("VAD_MERGE_GAP_MS", 300))       # shorter pauses stay inside a region
+VAD_PAD_MS = int(os.getenv("VAD_PAD_MS", 200))                   # context kept around each region
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", 250))     # less than this counts as no speech
+VAD_SEGMENT_TARGET_S = float(os.getenv("VAD_SEGMENT_TARGET_S", 15))
+VAD_SEGMENT_MAX_S = 30.0  # Whisper's window
+JOIN_GAP_S = 0.1          # silence inserted between regions glued into one segment
+ENERGY_ABS_SPEECH_DB = -45.0  # energy fallback: frames above this may be speech
+ENERGY_MIN_RANGE_DB = 10.0    # below this dynamic range there is no usable noise floor
+
+
+class VadResult(NamedTuple):
+    segments: List[np.ndarray]
+    total_seconds: float
+    speech_seconds: float
+
+    @property
+    def skipped_seconds(self) -> float:
+        return max(0.0, self.total_seconds - self.speech_seconds)
+
+
+def _energy_flags(frames: np.ndarray) -> np.ndarray:
+    # Fallback when webrtcvad isn't installed: frame energy against an adaptive noise floor.
+    rms_db = 20 * np.log10(np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-10)
+    noise_floor = np.percentile(rms_db, 10)
+    if np.percentile(rms_db, 90) - noise_floor < ENERGY_MIN_RANGE_DB:
+        # No pauses to estimate a floor from (e.g. push-to-talk released right after speaking):
+        # the 10th percentile is speech itself, so fall back to an absolute level
+        return rms_db > ENERGY_ABS_SPEECH_DB
+    return rms_db > max(noise_floor + 10.0, ENERGY_ABS_SPEECH_DB)
+
+
+def _webrtc_flags(frames: np.ndarray, sample_rate: int) -> np.ndarray:
+    vad = webrtcvad.Vad(VAD_AGGRESSIVENESS)
+    pcm = (np.clip(frames, -1.0, 1.0) * 32767).astype(np.int16)
+    return np.array([vad.is_speech(f.tobytes(), sample_rate) for f in pcm])
+
+
+def speech_regions(audio: np.ndarray, sample_rate: int) -> List[Tuple[int, int]]:
+    """(start, end) sample ranges containing speech, merged across short pauses and padded."""
+    frame_len = sample_rate * FRAME_MS // 1000
+    n_frames = len(audio) // frame_len
+    if n_frames == 0:
+        return []
+    frames = audio[:n_frames * frame_len].reshape(n_frames, frame_len)
+    flags = _webrtc_flags(frames, sample_rate) if webrtcvad is not None else _energy_flags(frames)
+
+    regions = []
+    start = None
+    for i, is_speech in enumerate(flags):
+        if is_speech and start is None:
+            start = i
+        elif not is_speech and start is not None:
+            regions.append([start, i])
+            start = None
+    if start is not None:
+        regions.append([start, n_frames])
+
+    merged = []
+    max_gap = VAD_MERGE_GAP_MS // FRAME_MS
+    for region in regions:
+        if merged and region[0] - merged[-1][1] <= max_gap:
+            merged[-1][1] = region[1]
+        else:
+            merged.append(region)
+
+    pad = VAD_PAD_MS * sample_rate // 1000
+    min_len = VAD_MIN_SPEECH_MS * sample_rate // 1000
+    out = []
+    for s, e in merged:
+        s, e = max(0, s * frame_len - pad), min(len(audio), e * frame_len + pad)
+        if out and s <= out[-1][1]:
+            out[-1] = (out[-1][0], e)
+        else:
+            out.append((s, e))
+    return [(s, e) for s, e in out if e - s >= min_len]
+
+
+def split_on_silence(audio: np.ndarray, sample_rate: int) -> VadResult:
+    """
+    Drops leading/trailing silence and pauses, then packs the speech regions (in order)
+    into segments of about VAD_SEGMENT_TARGET_S, never longer than Whisper's 30 s window.
+    """
+    total = len(audio) / sample_rate
+    regions = speech_regions(audio, sample_rate)
+    max_len = int(VAD_SEGMENT_MAX_S * sample_rate)
+    target_len = int(VAD_SEGMENT_TARGET_S * sample_rate)
+    gap = np.zeros(int(JOIN_GAP_S * sample_rate), dtype=np.float32)
+
+    pieces = []
+    for s, e in regions:
+        # A single region longer than Whisper's window is hard-split.
+        for cut in range(s, e, max_len):
+            pieces.append(audio[cut:min(e, cut + max_len)])
+
+    segments, current, current_len = [], [], 0
+    for piece in pieces:
+        if current and current_len + len(gap) + len(piece) > target_len:
+            segments.append(np.concatenate(current))
+            current, current_len = [], 0
+        if current:
+            current.append(gap)
+            current_len += len(gap)
+        current.append(piece)
+        current_len += len(piece)
+    if current:
+        segments.append(np.concatenate(current))
+
+    speech = sum(len(p) for p in pieces) / sample_rate
+    return VadResult(segments, total, speech)
@@ -1,52 +1,146 @@
 import os
 import json
+import time
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
-from vosk import Model, KaldiRecognizer
+from vosk import Model
+from recognizer_pool import RecognizerPool
 
 # ---- config ----
 MODEL_PATH = os.environ.get("VOSK_MODEL_PATH", "E:/XRAI/vosk-model-en-us-0.22-lgraph")       # E:/XRAI/vosk-model-en-us-0.22-lgraph
-SAMPLE_RATE = 16000  # expect 16 kHz PCM16 mono
+SAMPLE_RATE = 16000  # default; clients may pass ?sample_rate= (PCM16 mono either way)
+# Kaldi decoding releases the GIL, so a thread pool keeps the event loop free and lets
+# several streams decode in parallel. Size it to the cores you want Vosk to use.
+DECODE_THREADS = int(os.environ.get("VOSK_DECODE_THREADS", os.cpu_count() or 4))
+PARTIAL_INTERVAL_MS = int(os.environ.get("VOSK_PARTIAL_INTERVAL_MS", 200))  # at most one partial per interval
+MAX_IDLE_RECOGNIZERS = int(os.environ.get("VOSK_MAX_IDLE_RECOGNIZERS", 16))   # kept per sample rate
+# Each rate gets its own recognizer pool, so only these are accepted
+ALLOWED_SAMPLE_RATES = {8000, 16000, 44100, 48000}
 
 # ---- load model once ----
 model = Model(MODEL_PATH)
+recognizers = RecognizerPool(model, max_idle_per_rate=MAX_IDLE_RECOGNIZERS)
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix="vosk")
+
+# Live sessions, for /stats: id -> {"sample_rate", "audio_s", "decode_s", "started"}
+sessions = {}
+session_ids = itertools.count(1)
 
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.on_event("shutdown")
+async def stop_executor():
+    decode_executor.shutdown(wait=False)
+
 @app.get("/")
 def index():
     with open("static/vosk_index.html", "r", encoding="utf-8") as f:
         return HTMLResponse(f.read())
 
+def rtf(session: dict) -> float:
+    """Real-time factor: decode time per second of audio (below 1.0 keeps up with live speech)."""
+    return session["decode_s"] / session["audio_s"] if session["audio_s"] else 0.0
+
+def accept_chunk(rec, chunk: bytes, want_partial: bool):
+    # Runs on the decode pool; one call at a time per recognizer (the session awaits it).
+    started = time.perf_counter()
+    if rec.AcceptWaveform(chunk):
+        out = ("final", json.loads(rec.Result()).get("text", ""))
+    elif want_partial:
+        out = ("partial", json.loads(rec.PartialResult()).get("partial", ""))
+    else:
+        out = None
+    return out, time.perf_counter() - started
+
+def final_result(rec):
+    started = time.perf_counter()
+    text = json.loads(rec.FinalResult()).get("text", "")
+    return text, time.perf_counter() - started
+
 @app.websocket("/ws/transcribe")
 async def transcribe_ws(websocket: WebSocket):
     await websocket.accept()
-    rec = KaldiRecognizer(model, SAMPLE_RATE)
+    loop = asyncio.get_running_loop()
+    raw_rate = websocket.query_params.get("sample_rate", str(SAMPLE_RATE))
+    sample_rate = int(raw_rate) if raw_rate.isdigit() else None
+    if sample_rate not in ALLOWED_SAMPLE_RATES:
+        await websocket.close(code=1003, reason=f"sample_rate must be one of {sorted(ALLOWED_SAMPLE_RATES)}")
+        return
+    rec = recognizers.acquire(sample_rate)
+    session_id = next(session_ids)
+    session = sessions[session_id] = {"sample_rate": sample_rate, "audio_s": 0.0, "decode_s": 0.0,
+                                      "started": time.time()}
+    last_partial_at = 0.0
+    last_partial = None
+    finalized = False
     try:
         while True:
             message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
             if "bytes" in message and message["bytes"] is not None:
-                chunk = message["bytes"]  # raw PCM16 LE mono @16k
-                if rec.AcceptWaveform(chunk):
-                    result = json.loads(rec.Result())
-                    await websocket.send_json({"final": result.get("text", "")})
-                else:
-                    partial = json.loads(rec.PartialResult())
-                    await websocket.send_json({"partial": partial.get("partial", "")})
+                chunk = message["bytes"]  # raw PCM16 LE mono @ sample_rate
+                now = time.monotonic()
+                want_partial = (now - last_partial_at) * 1000 >= PARTIAL_INTERVAL_MS
+                out, decode_s = await loop.run_in_executor(decode_executor, accept_chunk, rec, chunk, want_partial)
+                session["audio_s"] += len(chunk) / 2 / sample_rate
+                session["decode_s"] += decode_s
+                if out is None:
+                    continue
+                kind, text = out
+                if kind == "final":
+                    last_partial = None
+                    await websocket.send_json({"final": text})
+                elif text != last_partial:
+                    last_partial_at, last_partial = now, text
+                    await websocket.send_json({"partial": text})
             elif "text" in message:
                 # optional control messages from client
                 if message["text"] == "close":
-                    final = json.loads(rec.FinalResult())
-                    await websocket.send_json({"final": final.get("text", "")})
+                    text, decode_s = await loop.run_in_executor(decode_executor, final_result, rec)
+                    session["decode_s"] += decode_s
+                    finalized = True
+                    await websocket.send_json({"final": text, "rtf": round(rtf(session), 3)})
                     await websocket.close()
                     break
     except WebSocketDisconnect:
         # client disconnected; finalize silently
-        _ = rec.FinalResult()
+        pass
     except Exception:
         try:
             await websocket.close()
         except Exception:
             pass
+    finally:
+        sessions.pop(session_id, None)
+        print(f"[Vosk] Session {session_id} closed: {session['audio_s']:.2f}s audio, RTF {rtf(session):.3f}")
+        try:
+            if not finalized:
+                await loop.run_in_executor(decode_executor, final_result, rec)
+        finally:
+            recognizers.release(sample_rate, rec)
+
+@app.get("/stats")
+async def stats():
+    """Decode pool, recognizer pool and per-session real-time factor."""
+    now = time.time()
+    return {
+        "decode_threads": DECODE_THREADS,
+        "partial_interval_ms": PARTIAL_INTERVAL_MS,
+        "recognizers": recognizers.stats(),
+        "sessions": {
+            sid: {
+                "sample_rate": s["sample_rate"],
+                "audio_s": round(s["audio_s"], 3),
+                "decode_s": round(s["decode_s"], 3),
+                "rtf": round(rtf(s), 3),
+                "age_s": round(now - s["started"], 1),
+            }
+            for sid, s in list(sessions.items())
+        },
+    }
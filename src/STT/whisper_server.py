@@ -1,63 +1,128 @@
-import io
 import os
-import tempfile
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, UploadFile, WebSocket
 from fastapi.params import File
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
-from pydub import AudioSegment
 import requests
-import whisper
+from audio_io import SAMPLE_RATE, StreamingDecoder, decode_audio_bytes
+from inference_pool import PoolSaturated, WhisperPool
+from vad import VAD_BACKEND, VadResult, split_on_silence
 
 
-AudioSegment.converter = "E:/XRAI/XR_RAG_LLM/ffmpeg/bin/ffmpeg.exe"
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-model = whisper.load_model("small")  # choose model size
+# Whisper runs as WHISPER_WORKERS model replicas in worker processes (see inference_pool.py).
+# At most WHISPER_MAX_QUEUE requests wait for a free replica; beyond that clients get a 503.
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")  # choose model size
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", 1))
+WHISPER_MAX_QUEUE = int(os.getenv("WHISPER_MAX_QUEUE", 8))
+whisper_pool = None
+
+# ffmpeg decoding blocks on a subprocess, so it runs on a small thread pool off the event loop.
+DECODE_WORKERS = int(os.getenv("WHISPER_DECODE_WORKERS", 4))
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="decode")
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() == "true"
 
 LLM_ENDPOINT = "http://192.168.0.232:8001/ask_xr"
 
-async def process_audio_and_transcribe(audio_bytes: bytes) -> str:
+@app.on_event("startup")
+async def start_pool():
+    global whisper_pool
+    whisper_pool = WhisperPool(WHISPER_MODEL, workers=WHISPER_WORKERS, max_queue=WHISPER_MAX_QUEUE)
+    await whisper_pool.warm_up()
+    if VAD_ENABLED and VAD_BACKEND != "webrtcvad":
+        print("[VAD] WARNING: webrtcvad is not installed; falling back to the energy-threshold detector, "
+              "which misjudges speech in noisy rooms. Install it with: pip install webrtcvad-wheels")
+    elif VAD_ENABLED:
+        print("[VAD] Using webrtcvad")
+
+@app.on_event("shutdown")
+async def stop_pool():
+    whisper_pool.shutdown()
+    decode_executor.shutdown(wait=False)
+
+async def transcribe_audio(audio_bytes: bytes) -> dict:
     """
-    Takes raw audio bytes, converts them, and returns the transcribed text.
-    This version explicitly creates, closes, and cleans up the temporary WAV file
-    to prevent any file-locking permission errors on Windows.
+    Takes raw audio bytes, decodes them in memory, trims silence with VAD, and returns the
+    transcription together with how much audio the model was spared.
+    Speech segments are transcribed in parallel on the Whisper pool.
+    Raises PoolSaturated when the request queue is full.
     """
-    print("--- Starting Audio Processing (Explicit File Path) ---")
-    
-    # Create a temporary file path for the WAV file
-    wav_fd, wav_path = tempfile.mkstemp(suffix=".wav")
-    os.close(wav_fd) # Close the file handle immediately
+    print("--- Starting Audio Processing (In-Memory) ---")
+
+    # Refuse early, before spending a decode on a request that can't be queued.
+    if not whisper_pool.has_capacity():
+        raise PoolSaturated(whisper_pool.retry_after())
 
     try:
-        # 1. Load initial audio data from memory
-        print("1. Loading audio from memory...")
-        audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-        
-        # 2. Export the audio to the temporary WAV file path.
-        #    pydub will handle opening, writing, and closing the file.
-        print(f"2. Converting and exporting to WAV file: {wav_path}")
-        audio = audio.set_channels(1).set_frame_rate(16000)
-        audio.export(wav_path, format="wav")
-        
-        # 3. Transcribe with Whisper. The file is now closed and safe to read.
-        print("3. Transcribing with Whisper...")
-        result = model.transcribe(wav_path, fp16=False)
-        transcribed_text = result["text"].strip()
-        
-        print(f"4. Transcription successful: '{transcribed_text}'")
-        return transcribed_text
+        # 1. Decode the uploaded container to 16 kHz mono float32 samples
+        print("1. Decoding audio in memory...")
+        loop = asyncio.get_running_loop()
+        audio = await loop.run_in_executor(decode_executor, decode_audio_bytes, audio_bytes)
+        return await transcribe_samples(audio)
 
+    except PoolSaturated:
+        raise
     except Exception as e:
         print(f"!!! A critical error occurred: {e}")
-        return f"[Error processing audio: {e}]"
+        return {"transcription": f"[Error processing audio: {e}]"}
+
+async def transcribe_samples(audio) -> dict:
+    """
+    VAD + pooled Whisper over already-decoded 16 kHz float32 samples. The request takes one
+    queue slot up front (PoolSaturated if there is none); its segments never add more.
+    """
+    with whisper_pool.admit():
+        return await _transcribe_admitted(audio)
+
+async def _transcribe_admitted(audio) -> dict:
+    loop = asyncio.get_running_loop()
+    # 2. Voice activity detection: drop silence, split long recordings at pauses
+    if VAD_ENABLED:
+        vad = await loop.run_in_executor(decode_executor, split_on_silence, audio, SAMPLE_RATE)
+    else:
+        vad = VadResult([audio], audio.shape[0] / SAMPLE_RATE, audio.shape[0] / SAMPLE_RATE)
+    print(f"2. Decoded {vad.total_seconds:.2f}s of audio, {vad.speech_seconds:.2f}s speech "
+          f"in {len(vad.segments)} segment(s), skipping {vad.skipped_seconds:.2f}s")
+    result = {
+        "transcription": "",
+        "audio_seconds": round(vad.total_seconds, 3),
+        "speech_seconds": round(vad.speech_seconds, 3),
+        "skipped_seconds": round(vad.skipped_seconds, 3),
+        "segments": len(vad.segments),
+    }
+    if not vad.segments:
+        print("3. No speech detected; skipping Whisper.")
+        return result
     
-    finally:
-        # 4. CRUCIAL: Clean up the temporary file, no matter what happens.
-        if os.path.exists(wav_path):
-            print(f"5. Cleaning up temporary file: {wav_path}")
-            os.remove(wav_path)
+    # 3. Transcribe the segments on pooled Whisper replicas, at most one per replica at a time
+    print("3. Transcribing with Whisper...")
+    per_request = asyncio.Semaphore(whisper_pool.workers)
+
+    async def transcribe_segment(segment):
+        async with per_request:
+            return await whisper_pool.transcribe(segment)
+
+    tasks = [asyncio.ensure_future(transcribe_segment(seg)) for seg in vad.segments]
+    try:
+        texts = await asyncio.gather(*tasks)
+    except BaseException:
+        # One segment failed: the request is lost, so don't leave its siblings on the replicas
+        for task in tasks:
+            task.cancel()
+        raise
+    result["transcription"] = " ".join(t for t in texts if t).strip()
+    
+    print(f"4. Transcription successful: '{result['transcription']}'")
+    return result
+
+async def process_audio_and_transcribe(audio_bytes: bytes) -> str:
+    """Returns just the transcribed text."""
+    return (await transcribe_audio(audio_bytes))["transcription"]
 
             
 @app.get("/")
@@ -70,13 +135,23 @@ async def index():
 async def http_transcribe(audio_file: UploadFile = File(...)):
     """
     Receives an audio file via HTTP POST, transcribes it, and returns
-    the transcription in a JSON response.
+    the transcription (plus VAD statistics) in a JSON response.
+    An empty transcription means no speech was detected.
     """
     audio_bytes = await audio_file.read()
-    transcribed_text = await process_audio_and_transcribe(audio_bytes)
+    try:
+        result = await transcribe_audio(audio_bytes)
+    except PoolSaturated as e:
+        return JSONResponse(status_code=503, content={"detail": str(e)},
+                            headers={"Retry-After": str(e.retry_after)})
     
     # Return a standard JSON response
-    return JSONResponse(content={"transcription": transcribed_text})
+    return JSONResponse(content=result)
+
+@app.get("/metrics")
+async def metrics():
+    """Queue depth, wait times and throughput of the Whisper pool."""
+    return whisper_pool.stats()
 
 @app.websocket("/ws/transcribe")
 async def ws_transcribe(ws: WebSocket):
@@ -127,7 +202,60 @@ async def ws_transcribe(ws: WebSocket):
         await ws.send_text(transcribed_text)
         await ws.close()
 
+    except PoolSaturated as e:
+        await ws.close(code=1013, reason=str(e))  # 1013: try again later
     except Exception as e:
         await ws.close()
         print("Error:", e)
 
+
+@app.websocket("/ws/stream")
+async def ws_stream(ws: WebSocket):
+    """
+    Streaming transcription over a persistent connection (used by the gateway).
+    Binary messages are consecutive chunks of one recording (e.g. MediaRecorder timeslices)
+    and are decoded as they arrive. The text message "end" finishes the utterance and answers
+    with a JSON result like /transcribe, keeping the socket open for the next one; "close"
+    does the same and then closes.
+    """
+    await ws.accept()
+    decoder = None
+    try:
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                if decoder is None:
+                    decoder = await StreamingDecoder().start()
+                await decoder.feed(message["bytes"])
+                continue
+
+            command = (message.get("text") or "").strip()
+            if command not in ("end", "close"):
+                continue
+            if decoder is None:
+                result = {"transcription": "", "audio_seconds": 0.0, "speech_seconds": 0.0,
+                          "skipped_seconds": 0.0, "segments": 0}
+            elif not whisper_pool.has_capacity():
+                await decoder.abort()
+                e = PoolSaturated(whisper_pool.retry_after())
+                result = {"transcription": "", "error": str(e), "retry_after": e.retry_after}
+            else:
+                print(f"--- Streamed utterance: {decoder.bytes_in} bytes, "
+                      f"{decoder.decoded_seconds:.2f}s decoded before end ---")
+                audio = await decoder.finish()
+                try:
+                    result = await transcribe_samples(audio)
+                except PoolSaturated as e:
+                    result = {"transcription": "", "error": str(e), "retry_after": e.retry_after}
+            decoder = None
+            await ws.send_json(result)
+            if command == "close":
+                await ws.close()
+                break
+    except Exception as e:
+        print("Error:", e)
+    finally:
+        if decoder is not None:
+            await decoder.abort()
@@ -0,0 +1,6 @@
+import os, sys
+
+# The service modules import each other by bare name (they run from their own directory)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for sub in ("src/RAG_LLM", "src/STT"):
+    sys.path.insert(0, os.path.join(ROOT, sub))
@@ -0,0 +1,63 @@
+import asyncio, threading
+
+import numpy as np
+
+from batching import MicroBatchEncoder
+
+
+class SlowModel:
+    """Blocks inside encode() until released, so a caller can cancel mid-batch."""
+
+    def __init__(self):
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def encode(self, texts, **kwargs):
+        self.entered.set()
+        self.release.wait(5)
+        return np.array([[float(len(t)), 1.0] for t in texts])
+
+
+def test_cancelled_future_does_not_kill_batcher():
+    model = SlowModel()
+    enc = MicroBatchEncoder(model, max_wait_ms=1)
+    try:
+        fut = enc.submit("cancel me")
+        assert model.entered.wait(5)
+        assert fut.cancel()
+        model.release.set()
+        vec = enc.submit("hello").result(timeout=5)
+        assert vec.tolist() == [5.0, 1.0]
+        assert enc._thread.is_alive()
+    finally:
+        enc.close()
+
+
+def test_cancelled_aencode_then_encode():
+    model = SlowModel()
+    enc = MicroBatchEncoder(model, max_wait_ms=1)
+
+    async def cancel_one():
+        task = asyncio.ensure_future(enc.aencode("cancel me"))
+        await asyncio.get_running_loop().run_in_executor(None, model.entered.wait, 5)
+        task.cancel()
+        await asyncio.sleep(0)
+
+    try:
+        asyncio.run(cancel_one())
+        model.release.set()
+        assert enc.submit("abc").result(timeout=5).tolist() == [3.0, 1.0]
+    finally:
+        enc.close()
+
+
+def test_cancelled_before_batch_is_skipped():
+    model = SlowModel()
+    model.release.set()
+    enc = MicroBatchEncoder(model, max_wait_ms=50)
+    try:
+        fut = enc.submit("gone")
+        fut.cancel()
+        assert enc.submit("kept").result(timeout=5).tolist() == [4.0, 1.0]
+    finally:
+        enc.close()
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+
+from lexical_index import BM25Index
+from retriever import HybridRetriever, SearchHit, fuse_rankings
+
+
+class FakeDense:
+    collection_name = "manuals"
+
+    def __init__(self, hits):
+        self.hits = hits
+
+    def search(self, query_vector, limit, should=None):
+        return self.hits[:limit]
+
+    def refresh(self, force=False):
+        pass
+
+
+def test_rrf_lexical_top_hit_beats_dense_tail():
+    dense = [(f"d{i}", 1.0 - i / 100) for i in range(40)]
+    fused = fuse_rankings([dense, [("code", 12.0)]], (0.5, 0.5), method="rrf", rrf_k=60)
+    top = [key for key, _ in fused[:40]]
+    assert "code" in top
+    assert "d39" not in top
+
+
+def test_hybrid_surfaces_lexical_only_hit(tmp_path):
+    dense_hits = [SearchHit(f"d{i}", 0.9 - i / 1000, {"chunk": f"general maintenance text {i}"}, 0.9)
+                  for i in range(40)]
+    payloads = [h.payload for h in dense_hits] + [{"chunk": "Error code E-4172: drain pump blocked"}]
+    ids = [h.id for h in dense_hits] + ["exact"]
+    path = str(tmp_path / "manuals.bm25.json")
+    BM25Index.build(ids, payloads).save(path)
+    hybrid = HybridRetriever(FakeDense(dense_hits), path, {"fusion": "rrf", "rrf_k": 60, "top_k_text": 40})
+    hits = hybrid.search(np.zeros(4, dtype=np.float32), 40, query_text="what does E-4172 mean")
+    assert "exact" in [h.id for h in hits]
+    exact = next(h for h in hits if h.id == "exact")
+    assert exact.similarity is None
+
+
+def test_hybrid_reloads_replaced_lexical_index(tmp_path):
+    path = str(tmp_path / "manuals.bm25.json")
+    hybrid = HybridRetriever(FakeDense([]), path, {"top_k_text": 10}, reload_check_seconds=3600)
+    assert hybrid.search(np.zeros(4, dtype=np.float32), 5, query_text="E-4172") == []
+
+    BM25Index.build(["old"], [{"chunk": "Error code E-4172"}]).save(path)
+    hybrid.refresh(force=True)
+    assert [h.id for h in hybrid.search(np.zeros(4, dtype=np.float32), 5, query_text="E-4172")] == ["old"]
+
+    BM25Index.build(["new"], [{"chunk": "Error code E-4172, revised"}]).save(path)
+    os.utime(path, (1, 1))  # a distinct mtime even on coarse-grained filesystems
+    hybrid.refresh(force=True)
+    assert [h.id for h in hybrid.search(np.zeros(4, dtype=np.float32), 5, query_text="E-4172")] == ["new"]
@@ -0,0 +1,31 @@
+from lexical_index import BM25Index
+
+DOCS = {
+    "a": "Error code E-4172: drain pump blocked",
+    "b": "Descale the boiler every three months",
+    "c": "Reset the WFW-9620 control board",
+    "d": "Drain pump filter sits behind the kick plate",
+}
+
+
+def build(keys):
+    return BM25Index.build(keys, [{"chunk": DOCS[k]} for k in keys])
+
+
+def results(index, query):
+    return [(index.ids[row], round(score, 6)) for row, score in index.search(query, 10)]
+
+
+def test_incremental_update_matches_full_build():
+    index = build(["a", "b", "c"])
+    assert index.remove_ids(["b"]) == 1
+    index.add(["d"], [{"chunk": DOCS["d"]}])
+    expected = build(["a", "c", "d"])
+    for query in ("drain pump", "wfw-9620", "descale boiler"):
+        assert results(index, query) == results(expected, query)
+
+
+def test_remove_unknown_ids_is_a_no_op():
+    index = build(["a", "b"])
+    assert index.remove_ids(["zzz"]) == 0
+    assert index.ids == ["a", "b"]
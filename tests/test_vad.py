@@ -0,0 +1,29 @@
+import numpy as np
+
+import vad
+
+SR = 16000
+
+
+def speech_like(seconds):
+    t = np.arange(int(seconds * SR)) / SR
+    return (0.1 * np.sin(2 * np.pi * 220 * t) * (1 + 0.2 * np.sin(2 * np.pi * 4 * t))).astype(np.float32)
+
+
+def test_energy_fallback_keeps_speech_without_pauses(monkeypatch):
+    monkeypatch.setattr(vad, "webrtcvad", None)
+    assert len(vad.split_on_silence(speech_like(4), SR).segments) == 1
+
+
+def test_energy_fallback_with_surrounding_silence(monkeypatch):
+    monkeypatch.setattr(vad, "webrtcvad", None)
+    audio = np.concatenate([np.zeros(SR), speech_like(4), np.zeros(SR)]).astype(np.float32)
+    result = vad.split_on_silence(audio, SR)
+    assert len(result.segments) == 1
+    assert result.skipped_seconds > 1.0
+
+
+def test_energy_fallback_ignores_quiet_noise(monkeypatch):
+    monkeypatch.setattr(vad, "webrtcvad", None)
+    noise = (np.random.default_rng(0).standard_normal(4 * SR) * 1e-4).astype(np.float32)
+    assert vad.split_on_silence(noise, SR).segments == []